@@ -1,13 +1,23 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import utils
+import hashlib
+import json
 import os
+import threading
+from collections import OrderedDict
+from datetime import date
 from werkzeug.utils import secure_filename
 import tempfile
 
 # Import ML forecasting module
 try:
     import ml_forecast
+    import forecast_store
+    materialized_forecast = forecast_store.MaterializedForecast()
+    # Load or train the models in the background; endpoints return 503 until ready
+    print("[ML] Initializing Waste Supply Forecaster...")
+    ml_forecast.start_warm_up()
     ML_ENABLED = True
     print("[APP] ML Forecasting module loaded successfully")
 except Exception as e:
@@ -25,6 +35,99 @@ CORS(app)
 UPLOAD_FOLDER = tempfile.gettempdir()
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
+# Seconds clients should wait before retrying while the forecaster warms up
+WARM_UP_RETRY_AFTER = 10
+
+def forecast_unavailable():
+    """
+    Returns an error response if forecasts can't be served yet, else None.
+    """
+    if not ML_ENABLED or ml_forecast.warm_up_state['status'] == 'failed':
+        return jsonify({'error': 'ML forecasting not available'}), 503
+    if not ml_forecast.is_ready():
+        response = jsonify({
+            'status': 'warming_up',
+            'message': 'Forecasting models are loading, retry shortly'
+        })
+        response.headers['Retry-After'] = str(WARM_UP_RETRY_AFTER)
+        return response, 503
+    return None
+
+def requested_quantiles():
+    """
+    Percentiles for the p10/p50/p90 bands if ?quantiles=true, else None.
+    """
+    if request.args.get('quantiles', '').lower() in ('1', 'true', 'yes'):
+        return ml_forecast.QUANTILES
+    return None
+
+def requested_list(name):
+    """
+    Comma-separated query parameter as a list, or None if absent.
+    """
+    value = request.args.get(name)
+    if value is None:
+        return None
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+def requested_int(name, default):
+    """
+    Integer query parameter (default if absent). Raises ValueError with a
+    client-facing message for a non-integer value.
+    """
+    try:
+        return int(request.args.get(name, default))
+    except ValueError:
+        raise ValueError(f'{name} must be an integer')
+
+def market_selection():
+    """
+    materials/regions/fields/daily_days query parameters of the market
+    forecast, as keyword arguments for get_market_forecast. Raises
+    ValueError for a non-integer daily_days.
+    """
+    return {
+        'materials': requested_list('materials'),
+        'regions': requested_list('regions'),
+        'fields': requested_list('fields'),
+        'daily_days': requested_int('daily_days', ml_forecast.DAILY_PREDICTION_DAYS)
+    }
+
+# Simulated city/dashboard responses keyed by (key, day, data version) -> (body, status, etag)
+MEMOIZED_RESPONSES_MAX = 512
+_memoized_responses = OrderedDict()
+_memoized_responses_lock = threading.Lock()
+
+def memoized_json(key, build):
+    """
+    JSON response for build(day) -> (payload, status), memoized per key,
+    day and utils.data_version(). The body is encoded once with sorted
+    keys, so identical data gives identical bytes and a strong ETag;
+    If-None-Match requests get a 304.
+    """
+    day = date.today()
+    memo_key = (key, day.isoformat(), utils.data_version())
+    with _memoized_responses_lock:
+        entry = _memoized_responses.get(memo_key)
+        if entry is not None:
+            _memoized_responses.move_to_end(memo_key)
+    
+    if entry is None:
+        payload, status = build(day)
+        body = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()
+        entry = (body, status, hashlib.sha256(body).hexdigest())
+        with _memoized_responses_lock:
+            _memoized_responses[memo_key] = entry
+            while len(_memoized_responses) > MEMOIZED_RESPONSES_MAX:
+                _memoized_responses.popitem(last=False)
+    
+    body, status, etag = entry
+    response = Response(body, status=status, mimetype='application/json')
+    response.set_etag(etag)
+    # Clients revalidate; the body changes at the day boundary or when the data files do
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -101,11 +204,10 @@ def guidance():
 def dashboard():
     """
     GET /api/dashboard
-    Returns mock city-level analytics
+    Returns mock city-level analytics, identical for the whole day (strong ETag)
     """
     try:
-        data = utils.get_dashboard_data()
-        return jsonify(data), 200
+        return memoized_json('dashboard', lambda day: (utils.get_dashboard_data(day), 200))
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -114,7 +216,8 @@ def dashboard():
 def city_data():
     """
     GET /api/city-data?city=Pune&state=Maharashtra
-    Returns real data for supported cities, or 404 if not found
+    Returns real data for supported cities, or 404 if not found.
+    Identical for the same city on the same day (strong ETag)
     """
     city = request.args.get('city')
     state = request.args.get('state')
@@ -122,18 +225,67 @@ def city_data():
     if not city:
         return jsonify({'message': 'City parameter required'}), 400
 
-    # 1. Try Comprehensive Multi-City CSV (New Dataset)
-    data = utils.get_multi_city_data(city)
-    if data:
-        return jsonify(data), 200
-        
-    # 2. Fallback to Legacy Pune Data (if specific CSV fails but legacy works)
-    if city.lower() == 'pune':
-        data = utils.get_pune_data()
+    def build(day):
+        # 1. Try Comprehensive Multi-City CSV (New Dataset)
+        data = utils.get_multi_city_data(city, day)
         if data:
-            return jsonify(data), 200
+            return data, 200
             
-    return jsonify({'message': 'No real data available, use mock'}), 404
+        # 2. Fallback to Legacy Pune Data (if specific CSV fails but legacy works)
+        if city.lower() == 'pune':
+            data = utils.get_pune_data(day)
+            if data:
+                return data, 200
+                
+        return {'message': 'No real data available, use mock'}, 404
+    
+    return memoized_json(('city-data', city.lower()), build)
+
+@app.route('/api/city-data/compare', methods=['GET'])
+def compare_city_data():
+    """
+    GET /api/city-data/compare?cities=Mumbai,Delhi&years=2022,2023&rank_by=recyclingRate&top=5&order=asc
+    Returns metrics for many cities and years in one response, optionally
+    ranked by recyclingRate, tonsPerDay, monthlyTons or co2Saved
+    (descending unless order=asc) and cut to the top N
+    """
+    try:
+        years = requested_list('years')
+        data = utils.compare_cities(
+            cities=requested_list('cities'),
+            years=[int(year) for year in years] if years is not None else None,
+            rank_by=request.args.get('rank_by'),
+            top=int(request.args['top']) if request.args.get('top') else None,
+            ascending=request.args.get('order', 'desc').lower() == 'asc'
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    if data is None:
+        return jsonify({'message': 'No real data available'}), 404
+    return jsonify(data), 200
+
+@app.route('/api/city-data/pune/wards', methods=['GET'])
+def pune_wards():
+    """
+    GET /api/city-data/pune/wards?ward=Kharadi-Chandan Nagar
+    Returns households, segregation and tonnage for every Pune ward,
+    or for one ward (by name or id) when ward is given
+    """
+    ward = request.args.get('ward')
+    
+    try:
+        data = utils.get_pune_ward_data(ward)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    if data is None:
+        return jsonify({'message': f'Ward not found: {ward}' if ward else 'Pune data not available'}), 404
+    if ward:
+        return jsonify(data), 200
+    return jsonify({'wards': data}), 200
 
 
 @app.route('/api/chat', methods=['POST'])
@@ -174,18 +326,27 @@ def chat():
 @app.route('/api/forecast/supply', methods=['GET'])
 def get_supply_forecast():
     """
-    GET /api/forecast/supply?material=PET&region=Mumbai&days=30
-    Returns predicted supply for specific material and region
+    GET /api/forecast/supply?material=PET&region=Mumbai&days=30&quantiles=true
+    Returns predicted supply for specific material and region, with
+    p10/p50/p90 per day when quantiles=true
     """
-    if not ML_ENABLED:
-        return jsonify({'error': 'ML forecasting not available'}), 503
+    unavailable = forecast_unavailable()
+    if unavailable:
+        return unavailable
     
     material = request.args.get('material', 'PET')
     region = request.args.get('region', 'Mumbai')
-    days = int(request.args.get('days', 30))
+    quantiles = requested_quantiles()
     
     try:
-        predictions = ml_forecast.forecaster.predict_future_supply(material, region, days)
+        days = requested_int('days', 30)
+        # Serve from the nightly materialized forecast when it is current (point values only)
+        predictions = None
+        snapshot = None if quantiles else materialized_forecast.is_current(ml_forecast.forecaster.model_version, days)
+        if snapshot:
+            predictions = materialized_forecast.predict_future_supply(material, region, days, snapshot)
+        if predictions is None:
+            predictions = ml_forecast.forecast_cache.predict_future_supply(material, region, days, quantiles)
         total_volume = sum(p['predicted_volume'] for p in predictions)
         
         return jsonify({
@@ -195,43 +356,149 @@ def get_supply_forecast():
             'total_predicted_volume': round(total_volume, 2),
             'predictions': predictions
         }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/forecast/market', methods=['GET'])
 def get_market_forecast():
     """
-    GET /api/forecast/market?days=90
-    Returns complete market forecast for all materials and regions
+    GET /api/forecast/market?days=90&quantiles=true&format=ndjson
+        &materials=PET,HDPE&regions=Mumbai,Delhi&fields=total_volume_tons&daily_days=7
+    Returns complete market forecast for all materials and regions, with
+    p10/p50/p90 on the daily predictions when quantiles=true.
+    format=ndjson streams one {"material", "region", ...} line per series
+    as soon as it is computed instead of one JSON document.
+    materials/regions restrict the series, fields picks total_volume_tons
+    and/or daily_predictions and daily_days sets the daily window
+    (default 30); only the selected cells are computed.
     """
-    if not ML_ENABLED:
-        return jsonify({'error': 'ML forecasting not available'}), 503
+    unavailable = forecast_unavailable()
+    if unavailable:
+        return unavailable
     
-    days = int(request.args.get('days', 90))
+    quantiles = requested_quantiles()
+    try:
+        days = requested_int('days', 90)
+        selection = market_selection()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if request.args.get('format') == 'ndjson':
+        return stream_market_forecast(days, quantiles, selection)
     
     try:
-        forecast = ml_forecast.forecaster.get_market_forecast(days)
+        snapshot = None if quantiles else materialized_forecast.is_current(ml_forecast.forecaster.model_version, days)
+        if snapshot:
+            forecast = materialized_forecast.get_market_forecast(days, snapshot, **selection)
+        else:
+            forecast = ml_forecast.forecast_cache.get_market_forecast(days, quantiles, **selection)
         return jsonify({
             'days_ahead': days,
             'forecast': forecast
         }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def stream_market_forecast(days, quantiles=None, selection=None):
+    """
+    Chunked NDJSON response for the market forecast, one line per
+    (material, region). A failure after streaming started is reported as
+    a final {"error": ...} line.
+    """
+    selection = selection or {}
+    try:
+        snapshot = None if quantiles else materialized_forecast.is_current(ml_forecast.forecaster.model_version, days)
+        if snapshot:
+            records = materialized_forecast.iter_market_forecast(days, snapshot=snapshot, **selection)
+        else:
+            records = ml_forecast.forecaster.iter_market_forecast(days, quantiles, **selection)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def generate():
+        try:
+            for record in records:
+                yield json.dumps(record) + '\n'
+        except Exception as e:
+            yield json.dumps({'error': str(e)}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/api/forecast/materials', methods=['GET'])
 def get_material_types():
     """
     GET /api/forecast/materials
     Returns list of available material types and regions
     """
-    if not ML_ENABLED:
-        return jsonify({'error': 'ML forecasting not available'}), 503
+    unavailable = forecast_unavailable()
+    if unavailable:
+        return unavailable
     
     return jsonify({
         'materials': ml_forecast.forecaster.material_types,
         'regions': ml_forecast.forecaster.regions
     }), 200
 
+@app.route('/api/forecast/observations', methods=['POST'])
+def ingest_supply_observations():
+    """
+    POST /api/forecast/observations
+    Body: {"observations": [{"date", "region", "material_type", "volume_tons"}],
+           "update": "warm_start" | "window" | null}
+    Appends new daily observations and incrementally refreshes the models.
+    A window refit retrains every model, so it runs in the background:
+    the response is 202 and progress is at /api/forecast/observations/refit
+    """
+    unavailable = forecast_unavailable()
+    if unavailable:
+        return unavailable
+    
+    data = request.get_json()
+    if not data or not data.get('observations'):
+        return jsonify({'error': 'observations are required'}), 400
+    
+    try:
+        update = ml_forecast.forecaster.resolve_update(data.get('update', 'warm_start'))
+        if update == 'window':
+            if not ml_forecast.start_window_refit(data['observations']):
+                return jsonify({'error': 'A window refit is already running',
+                                'refit': dict(ml_forecast.refit_state)}), 409
+            return jsonify({'status': 'accepted', 'refit': dict(ml_forecast.refit_state)}), 202
+        result = ml_forecast.forecaster.ingest_observations(data['observations'], update=update)
+        return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/forecast/observations/refit', methods=['GET'])
+def get_refit_status():
+    """
+    GET /api/forecast/observations/refit
+    Status of the latest background window refit
+    """
+    unavailable = forecast_unavailable()
+    if unavailable:
+        return unavailable
+    
+    return jsonify(ml_forecast.refit_state), 200
+
+@app.route('/api/forecast/cache', methods=['GET'])
+def get_forecast_cache_stats():
+    """
+    GET /api/forecast/cache
+    Returns hit/miss counters for the in-process forecast cache
+    """
+    unavailable = forecast_unavailable()
+    if unavailable:
+        return unavailable
+    
+    return jsonify(ml_forecast.forecast_cache.stats()), 200
+
 # ============================================================
 # MARKETPLACE ENDPOINTS
 # ============================================================
@@ -294,6 +561,17 @@ def health():
     """Health check endpoint"""
     return jsonify({'status': 'ok'}), 200
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness endpoint: 200 once the forecasting models are loaded"""
+    if not ML_ENABLED:
+        return jsonify({'status': 'disabled', 'ml_ready': False}), 503
+    
+    state = dict(ml_forecast.warm_up_state)
+    state['ml_ready'] = ml_forecast.is_ready()
+    state['model_version'] = ml_forecast.forecaster.model_version
+    return jsonify(state), 200 if state['ml_ready'] else 503
+
 
 # Vercel serverless function handler
 def handler(request):
@@ -0,0 +1,467 @@
+"""
+Timing benchmarks for the ML forecasting pipeline.
+
+Run from the backend directory:
+    python benchmark_forecast.py compare --scales 1 10 100
+        Old vs new implementations on the real data; prepare_features is
+        also timed on the data scaled up by each factor.
+    python benchmark_forecast.py engines --engines random_forest seasonal_linear
+        R², fit time, predict latency and model size per forecasting engine
+        on the real data.
+    python benchmark_forecast.py suite --regions 10 50 100 --materials 7 --days 1826 --output bench.json
+        Per-stage time and peak memory on a synthetic workload, one run per
+        parameter combination, written as JSON for comparing revisions.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import pickle
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from ml_forecast import ENGINE_PARAMS, WasteSupplyForecaster, export_training_data, load_training_data
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_load_real_data():
+    """
+    Compare the vectorized daily interpolation against the per-day loop.
+    """
+    print("\n=== load_real_data: loop vs vectorized ===")
+    loop_df, loop_time = _timed(WasteSupplyForecaster().load_real_data, vectorized=False)
+    vec_df, vec_time = _timed(WasteSupplyForecaster().load_real_data, vectorized=True)
+    
+    same_shape = loop_df.shape == vec_df.shape
+    max_diff = np.abs(loop_df['volume_tons'].to_numpy() - vec_df['volume_tons'].to_numpy()).max() if same_shape else float('nan')
+    keys_match = same_shape and loop_df.drop(columns='volume_tons').equals(vec_df.drop(columns='volume_tons'))
+    
+    print(f"Rows:        {len(vec_df)}")
+    print(f"Loop:        {loop_time:.3f}s")
+    print(f"Vectorized:  {vec_time:.3f}s ({loop_time / vec_time:.1f}x faster)")
+    print(f"Keys match:  {keys_match}, max volume diff: {max_diff:.4f}")
+    
+    return {'rows': len(vec_df), 'loop_s': loop_time, 'vectorized_s': vec_time}
+
+
+def bench_training_data_export(df):
+    """
+    Compare the indented JSON dump of the training data against the
+    compressed columnar export, for both writing and reading back.
+    """
+    print("\n=== training data export: JSON vs columnar NPZ ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, 'training.json')
+        npz_path = os.path.join(tmp, 'training.npz')
+        
+        _, json_write = _timed(df.to_json, json_path, orient='records', indent=2)
+        _, json_read = _timed(pd.read_json, json_path, orient='records')
+        _, npz_write = _timed(export_training_data, df, npz_path)
+        _, npz_read = _timed(load_training_data, npz_path)
+        json_mb = os.path.getsize(json_path) / 2**20
+        npz_mb = os.path.getsize(npz_path) / 2**20
+    
+    print(f"{'format':<8} {'size MB':>9} {'write s':>9} {'read s':>9}")
+    print(f"{'json':<8} {json_mb:>9.1f} {json_write:>9.3f} {json_read:>9.3f}")
+    print(f"{'npz':<8} {npz_mb:>9.1f} {npz_write:>9.3f} {npz_read:>9.3f}")
+    
+    return {'json_mb': json_mb, 'npz_mb': npz_mb, 'json_read_s': json_read, 'npz_read_s': npz_read}
+
+
+def _per_day_predict(model, seed, days_ahead, recursive):
+    """
+    Reference implementation: one model.predict call per future day.
+    """
+    predictions = []
+    region_code, prev_7day_avg, prev_30day_avg = seed
+    for day in range(days_ahead):
+        future_date = datetime.now() + timedelta(days=day)
+        features = np.array([[future_date.weekday(), future_date.month, prev_7day_avg, prev_30day_avg, region_code]])
+        predicted_volume = model.predict(features)[0]
+        predictions.append(round(float(predicted_volume), 2))
+        if recursive:
+            prev_7day_avg = predicted_volume
+    return predictions
+
+
+def bench_predict_future_supply(forecaster, material='PET', days_ahead=90):
+    """
+    Time per-day model.predict calls against each batched prediction mode.
+    """
+    print(f"\n=== predict_future_supply: {material}, {days_ahead} days ===")
+    region = forecaster.regions[0]
+    model = forecaster.models[material]
+    seed = [float(values[0]) for values in forecaster._series_seed(material, [region])]
+    
+    results = {}
+    for recursive, mode in ((False, 'fixed'), (True, 'recursive')):
+        reference, ref_time = _timed(_per_day_predict, model, seed, days_ahead, recursive)
+        batched, batch_time = _timed(forecaster.predict_future_supply, material, region, days_ahead, mode=mode)
+        matches = reference == [p['predicted_volume'] for p in batched]
+        print(f"{mode:<10} per-day: {ref_time:.3f}s  batched: {batch_time:.3f}s  ({ref_time / batch_time:.1f}x)  matches: {matches}")
+        results[mode] = {'per_day_s': ref_time, 'batched_s': batch_time, 'matches': matches}
+    
+    _, block_time = _timed(forecaster.predict_future_supply, material, region, days_ahead, mode='block')
+    print(f"{'block':<10} batched: {block_time:.3f}s")
+    results['block'] = {'batched_s': block_time}
+    return results
+
+
+def _legacy_prepare_features(df):
+    """
+    Reference implementation: per-series Python lambda rolling means.
+    """
+    df = df.sort_values('date')
+    for window in (7, 30):
+        df[f'prev_{window}day_avg'] = df.groupby(['region', 'material_type'])['volume_tons'].transform(
+            lambda x: x.rolling(window=window, min_periods=1).mean()
+        )
+    return df
+
+
+def _scale_regions(df, scale):
+    """
+    Grow the training frame by cloning every region `scale` times.
+    """
+    if scale == 1:
+        return df
+    frames = []
+    for i in range(scale):
+        clone = df.copy()
+        clone['region'] = clone['region'] + f'_{i}'
+        frames.append(clone)
+    return pd.concat(frames, ignore_index=True)
+
+
+def bench_prepare_features(df, scales=(1, 10, 100)):
+    """
+    Time the per-series lambda rolling against the cumulative-sum stage at
+    growing row counts (100x needs several GB of RAM).
+    """
+    print("\n=== prepare_features: lambda rolling vs cumulative sums ===")
+    if max(scales) >= 100:
+        print(f"Note: {max(scales)}x is {max(scales) * len(df)} rows and needs several GB of RAM "
+              f"(pass --scales 1 10 to skip it)")
+    forecaster = WasteSupplyForecaster()
+    results = {}
+    for scale in scales:
+        scaled = _scale_regions(df, scale)
+        _, legacy_time = _timed(_legacy_prepare_features, scaled.copy())
+        _, vec_time = _timed(forecaster.prepare_features, scaled)
+        _, extended_time = _timed(forecaster.prepare_features, scaled, windows=(7, 30, 90), lags=(1, 7), same_day_last_year=True)
+        print(f"{scale:>4}x {len(scaled):>10} rows  lambda: {legacy_time:.3f}s  vectorized: {vec_time:.3f}s "
+              f"({legacy_time / vec_time:.1f}x)  +90d/lags/last-year: {extended_time:.3f}s")
+        results[scale] = {'rows': len(scaled), 'lambda_s': legacy_time, 'vectorized_s': vec_time, 'extended_s': extended_time}
+        del scaled
+    return results
+
+
+def _proc_memory_mb():
+    """
+    RSS split into private (anon) and file-backed (shareable) pages, plus
+    the peak RSS (VmHWM), in MB (Linux).
+    """
+    fields = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'VmHWM', 'RssAnon', 'RssFile'):
+                fields[key] = int(value.split()[0]) / 1024
+    return fields
+
+
+def _model_memory_worker(_):
+    """
+    Simulate one server worker: import the forecaster and serve a forecast.
+    """
+    import ml_forecast
+    ml_forecast.wait_until_ready()
+    ml_forecast.forecaster.get_market_forecast(90)
+    return _proc_memory_mb()
+
+
+def bench_model_memory(n_workers=4):
+    """
+    RSS per worker with the FlatForest arrays read into memory vs memory-mapped.
+    File-backed pages of the mapped models are shared between workers.
+    """
+    print(f"\n=== model memory: {n_workers} workers ===")
+    ctx = multiprocessing.get_context('spawn')
+    results = {}
+    previous = os.environ.get('ML_MMAP_MODELS')
+    for label, mmap in (('memory', False), ('mmap', True)):
+        # Spawned workers read ML_MMAP_MODELS when they import ml_forecast
+        os.environ['ML_MMAP_MODELS'] = '1' if mmap else '0'
+        with ctx.Pool(n_workers) as pool:
+            stats = pool.map(_model_memory_worker, range(n_workers))
+        avg = {key: sum(s[key] for s in stats) / n_workers for key in stats[0]}
+        print(f"{label:<7} RSS/worker: {avg['VmRSS']:.0f} MB  private: {avg['RssAnon']:.0f} MB  file-backed (shared): {avg['RssFile']:.0f} MB")
+        results[label] = avg
+    if previous is None:
+        os.environ.pop('ML_MMAP_MODELS', None)
+    else:
+        os.environ['ML_MMAP_MODELS'] = previous
+    return results
+
+
+def bench_get_market_forecast(forecaster, days_ahead=90, workers=(None, 4)):
+    """
+    Time the full market forecast serially and with a material process pool.
+    """
+    print(f"\n=== get_market_forecast: {len(forecaster.regions)} regions, {days_ahead} days ===")
+    results = {}
+    for n_workers in workers:
+        _, elapsed = _timed(forecaster.get_market_forecast, days_ahead, workers=n_workers)
+        label = f"workers={n_workers or 1}"
+        print(f"{label:<10} {elapsed:.3f}s")
+        results[label] = elapsed
+    return results
+
+
+def bench_generate_synthetic_data(sizes=((6, 180), (1000, 1826))):
+    """
+    Throughput of the array-based synthetic generator for (regions, days) sizes.
+    """
+    print("\n=== generate_synthetic_data throughput ===")
+    results = {}
+    for n_regions, n_days in sizes:
+        forecaster = WasteSupplyForecaster()
+        regions = [f'City_{i}' for i in range(n_regions)]
+        df, elapsed = _timed(forecaster.generate_synthetic_data, days=n_days, regions=regions)
+        output_gb = df.memory_usage().sum() / 1e9
+        print(f"{n_regions:>5} regions x {n_days} days: {len(df):>10} rows in {elapsed:.3f}s "
+              f"({len(df) / elapsed / 1e6:.1f}M rows/s, {output_gb / elapsed:.2f} GB/s written)")
+        results[(n_regions, n_days)] = {'rows': len(df), 'seconds': elapsed}
+    return results
+
+
+def _write_workload_csv(path, n_regions, n_materials, start_year, end_year, seed=0):
+    """
+    Synthetic yearly CSV in the real dataset's schema: one waste type per
+    material, a random TPD per (city, type, year).
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for region in range(n_regions):
+        for material in range(n_materials):
+            base = rng.uniform(100, 10000)
+            for year in range(start_year, end_year + 1):
+                rows.append({
+                    'City/District': f'City_{region}',
+                    'Waste Type': f'Type_{material}',
+                    'Waste Generated (Tons/Day)': round(base * rng.uniform(0.9, 1.1)),
+                    'Year': year
+                })
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+def _workload_forecaster(n_materials, n_days):
+    forecaster = WasteSupplyForecaster()
+    forecaster.material_types = [f'Material_{m}' for m in range(n_materials)]
+    forecaster.type_map = {f'Type_{m}': [f'Material_{m}'] for m in range(n_materials)}
+    forecaster.history_start = datetime(2019, 1, 1)
+    forecaster.history_end = forecaster.history_start + timedelta(days=n_days - 1)
+    return forecaster
+
+
+def _reset_peak_rss():
+    """
+    Reset this process's peak RSS (VmHWM) so it tracks one stage (Linux).
+    Returns False where the kernel does not allow it.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class _RssSampler(threading.Thread):
+    """
+    Polls VmRSS while a stage runs, for kernels without a VmHWM reset.
+    """
+    
+    def __init__(self, interval=0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = _proc_memory_mb()['VmRSS']
+        self.done = threading.Event()
+    
+    def run(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, _proc_memory_mb()['VmRSS'])
+
+
+def _measured(fn, *args, **kwargs):
+    """
+    Run fn once, returning (result, stats). peak_rss_mb is the process's
+    peak resident memory during the stage, including native allocations
+    (sklearn builds trees with C realloc, which tracemalloc never sees);
+    python_peak_mb is the tracemalloc peak of the Python heap alone.
+    """
+    sampler = None
+    if not _reset_peak_rss():
+        sampler = _RssSampler()
+        sampler.start()
+    start_rss = _proc_memory_mb()['VmRSS']
+    tracemalloc.start()
+    try:
+        result, elapsed = _timed(fn, *args, **kwargs)
+        _, python_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    if sampler is None:
+        peak_rss = _proc_memory_mb()['VmHWM']
+    else:
+        sampler.done.set()
+        sampler.join()
+        peak_rss = max(sampler.peak, _proc_memory_mb()['VmRSS'])
+    return result, {
+        'seconds': round(elapsed, 4),
+        'peak_rss_mb': round(peak_rss, 2),
+        'rss_start_mb': round(start_rss, 2),
+        'python_peak_mb': round(python_peak / 2**20, 2)
+    }
+
+
+def run_workload(n_regions, n_materials, n_days, horizon=90, n_jobs=None):
+    """
+    Time and measure each pipeline stage separately on one synthetic workload.
+    """
+    forecaster = _workload_forecaster(n_materials, n_days)
+    stages = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, 'workload.csv')
+        _write_workload_csv(csv_path, n_regions, n_materials,
+                            forecaster.history_start.year, forecaster.history_end.year)
+        df, stages['load_real_data'] = _measured(forecaster.load_real_data, csv_path=csv_path)
+    _, stages['prepare_features'] = _measured(forecaster.prepare_features, df)
+    _, stages['train_models'] = _measured(forecaster.train_models, df, n_jobs=n_jobs)
+    _, stages['predict_future_supply'] = _measured(
+        forecaster.predict_future_supply, forecaster.material_types[0], forecaster.regions[0], horizon
+    )
+    _, stages['get_market_forecast'] = _measured(forecaster.get_market_forecast, horizon)
+    return {
+        'params': {'regions': n_regions, 'materials': n_materials, 'days': n_days,
+                   'horizon': horizon, 'rows': len(df)},
+        'stages': stages
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_suite(regions, materials, days, horizon=90, n_jobs=None, output=None):
+    """
+    Run every (regions, materials, days) combination and optionally write
+    the results as JSON.
+    """
+    results = []
+    for n_regions, n_materials, n_days in itertools.product(regions, materials, days):
+        print(f"\n=== workload: {n_regions} regions x {n_materials} materials x {n_days} days ===")
+        result = run_workload(n_regions, n_materials, n_days, horizon, n_jobs)
+        for stage, stats in result['stages'].items():
+            print(f"{stage:<22} {stats['seconds']:>9.3f}s  peak RSS {stats['peak_rss_mb']:>9.1f} MB "
+                  f"(+{stats['peak_rss_mb'] - stats['rss_start_mb']:.1f} MB)  Python heap {stats['python_peak_mb']:>8.1f} MB")
+        results.append(result)
+    
+    report = {
+        'revision': _git_revision(),
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'note': ('peak_rss_mb is the process peak RSS during the stage (VmHWM, reset per stage), '
+                 'rss_start_mb the RSS when it started; python_peak_mb is the tracemalloc peak of '
+                 'the Python heap only; seconds include tracing overhead'),
+        'results': results
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {output}")
+    return report
+
+
+def bench_engines(df, engines=tuple(ENGINE_PARAMS), days_ahead=90, repeats=3):
+    """
+    Train every engine on the same data and split, then report mean test
+    R² over materials, fit time, market forecast latency and pickled size.
+    """
+    print(f"\n=== forecasting engines: {len(df)} rows, {days_ahead}-day market forecast ===")
+    results = {}
+    for engine in engines:
+        forecaster = WasteSupplyForecaster(engine=engine)
+        _, fit_time = _timed(forecaster.train_models, df)
+        predict_time = min(_timed(forecaster.get_market_forecast, days_ahead)[1] for _ in range(repeats))
+        results[engine] = {
+            'test_r2': float(np.mean([r['test_r2'] for r in forecaster.training_report.values()])),
+            'fit_s': fit_time,
+            'predict_s': predict_time,
+            'size_mb': sum(len(pickle.dumps(m)) for m in forecaster.models.values()) / 2**20
+        }
+    
+    print(f"{'engine':<24} {'test R²':>8} {'fit s':>8} {'predict s':>10} {'size MB':>9}")
+    for engine, r in results.items():
+        print(f"{engine:<24} {r['test_r2']:>8.3f} {r['fit_s']:>8.2f} {r['predict_s']:>10.3f} {r['size_mb']:>9.2f}")
+    
+    return results
+
+
+def run_comparisons(scales=(1, 10, 100)):
+    import ml_forecast
+    
+    ml_forecast.wait_until_ready()
+    bench_load_real_data()
+    real_df = WasteSupplyForecaster().load_real_data()
+    bench_training_data_export(real_df)
+    bench_prepare_features(real_df, scales)
+    bench_generate_synthetic_data()
+    bench_predict_future_supply(ml_forecast.forecaster)
+    bench_get_market_forecast(ml_forecast.forecaster)
+    bench_model_memory()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the ML forecasting pipeline.')
+    commands = parser.add_subparsers(dest='command')
+    compare = commands.add_parser('compare', help='old vs new implementations on the real data')
+    compare.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100],
+                         help='prepare_features data scale factors (100x needs several GB of RAM)')
+    engines = commands.add_parser('engines', help='accuracy, latency and size per forecasting engine')
+    engines.add_argument('--engines', nargs='+', default=list(ENGINE_PARAMS), choices=list(ENGINE_PARAMS))
+    engines.add_argument('--horizon', type=int, default=90)
+    suite = commands.add_parser('suite', help='per-stage time and peak memory on synthetic workloads')
+    suite.add_argument('--regions', type=int, nargs='+', default=[34])
+    suite.add_argument('--materials', type=int, nargs='+', default=[7])
+    suite.add_argument('--days', type=int, nargs='+', default=[1826])
+    suite.add_argument('--horizon', type=int, default=90)
+    suite.add_argument('--jobs', type=int, default=None, help='train_models CPU budget')
+    suite.add_argument('--output', help='write results JSON to this path')
+    args = parser.parse_args()
+    
+    if args.command == 'suite':
+        run_suite(args.regions, args.materials, args.days, args.horizon, args.jobs, args.output)
+    elif args.command == 'engines':
+        bench_engines(WasteSupplyForecaster().load_real_data(), args.engines, args.horizon)
+    else:
+        run_comparisons(getattr(args, 'scales', (1, 10, 100)))
@@ -0,0 +1,224 @@
+"""
+Nightly forecast materialization.
+
+Precomputes the full forecast for every material, region and horizon day
+and writes it as a memory-mapped NumPy array, so the Flask forecast
+endpoints can serve slices of it instead of running inference per request.
+
+Run as a batch job (e.g. nightly from cron), from the backend directory:
+    python forecast_store.py --days 90
+"""
+import argparse
+import json
+import os
+import shutil
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from ml_forecast import DAILY_PREDICTION_DAYS, MARKET_FIELDS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FORECASTS_DIR = os.path.join(BASE_DIR, 'forecasts')
+LATEST_POINTER = 'latest.json'
+
+
+def materialize_forecasts(forecaster, path=FORECASTS_DIR, days_ahead=90, start_date=None):
+    """
+    Score every material x region x day with the forecaster and write the
+    result to path/<date>_<model version>/volumes.npy plus meta.json.
+    Returns the directory written.
+    """
+    start = pd.Timestamp(start_date or datetime.now()).normalize()
+    date_strings, day_of_week, month = forecaster._horizon_calendar(days_ahead, start)
+    materials = [m for m in forecaster.material_types if m in forecaster.models]
+    regions = list(forecaster.regions)
+
+    print(f"[Forecasts] Materializing {len(materials)} materials x {len(regions)} regions x {days_ahead} days...")
+    volumes = np.empty((len(materials), len(regions), days_ahead))
+    for i, material in enumerate(materials):
+        volumes[i] = forecaster._predict_horizon(material, regions, day_of_week, month)
+    volumes = np.round(volumes, 2)
+
+    version = f"{start.strftime('%Y-%m-%d')}_{forecaster.model_version or 'unsaved'}"
+    version_dir = os.path.join(path, version)
+    tmp_dir = f"{version_dir}.tmp{os.getpid()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    np.save(os.path.join(tmp_dir, 'volumes.npy'), volumes)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump({
+            'start_date': date_strings[0] if days_ahead else start.strftime('%Y-%m-%d'),
+            'days_ahead': days_ahead,
+            'materials': materials,
+            'regions': regions,
+            'model_version': forecaster.model_version,
+            'created_at': datetime.now().isoformat()
+        }, f, indent=2)
+
+    if os.path.exists(version_dir):
+        shutil.rmtree(version_dir)
+    os.replace(tmp_dir, version_dir)
+
+    # Point readers at the new version atomically
+    pointer_tmp = os.path.join(path, f"{LATEST_POINTER}.tmp{os.getpid()}")
+    with open(pointer_tmp, 'w') as f:
+        json.dump({'version': version}, f)
+    os.replace(pointer_tmp, os.path.join(path, LATEST_POINTER))
+
+    print(f"[Forecasts] Wrote {version_dir}")
+    return version_dir
+
+
+# One opened forecast version; never modified, refresh() swaps in a new one
+ForecastSnapshot = namedtuple('ForecastSnapshot', ['meta', 'volumes', 'material_index', 'region_index'])
+
+
+class MaterializedForecast:
+    """
+    Read-only view over the latest materialized forecast. The volumes array
+    is memory-mapped, so every server worker shares one page-cache copy.
+    
+    The opened version is held as one immutable ForecastSnapshot:
+    is_current()/refresh() return it and the slicing methods take it, so
+    a request never mixes two versions when the pointer moves.
+    """
+
+    def __init__(self, path=FORECASTS_DIR):
+        self.path = path
+        self._snapshot = None
+        self._pointer_mtime = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Re-open the latest version if the pointer file changed.
+        Returns the current ForecastSnapshot, or None if none is available.
+        """
+        pointer_path = os.path.join(self.path, LATEST_POINTER)
+        with self._lock:
+            try:
+                mtime = os.stat(pointer_path).st_mtime_ns
+            except OSError:
+                self._snapshot = self._pointer_mtime = None
+                return None
+
+            if mtime != self._pointer_mtime:
+                try:
+                    with open(pointer_path) as f:
+                        version_dir = os.path.join(self.path, json.load(f)['version'])
+                    with open(os.path.join(version_dir, 'meta.json')) as f:
+                        meta = json.load(f)
+                    volumes = np.load(os.path.join(version_dir, 'volumes.npy'), mmap_mode='r')
+                except Exception as e:
+                    print(f"[Forecasts] Error opening materialized forecast: {e}")
+                    self._snapshot = self._pointer_mtime = None
+                    return None
+
+                self._snapshot = ForecastSnapshot(
+                    meta, volumes,
+                    {m: i for i, m in enumerate(meta['materials'])},
+                    {r: i for i, r in enumerate(meta['regions'])}
+                )
+                self._pointer_mtime = mtime
+            return self._snapshot
+
+    def is_current(self, model_version=None, days_ahead=0):
+        """
+        The snapshot if a forecast starting today, covering days_ahead and
+        (when given) produced by model_version is available, else None.
+        """
+        snapshot = self.refresh()
+        if snapshot is None:
+            return None
+        meta = snapshot.meta
+        if meta['start_date'] != datetime.now().strftime('%Y-%m-%d'):
+            return None
+        if model_version is not None and meta['model_version'] != model_version:
+            return None
+        return snapshot if days_ahead <= meta['days_ahead'] else None
+
+    def _dates(self, snapshot, days_ahead):
+        dates = pd.date_range(snapshot.meta['start_date'], periods=days_ahead, freq='D')
+        return dates.strftime('%Y-%m-%d').tolist()
+
+    def predict_future_supply(self, material_type, region, days_ahead=30, snapshot=None):
+        """
+        Slice one series of snapshot (default: the latest); same shape as
+        WasteSupplyForecaster.predict_future_supply. Returns None when the
+        material or region was not materialized.
+        """
+        snapshot = snapshot or self.refresh()
+        if snapshot is None:
+            return None
+        if material_type not in snapshot.material_index or region not in snapshot.region_index:
+            return None
+        series = snapshot.volumes[snapshot.material_index[material_type], snapshot.region_index[region], :days_ahead]
+        return [
+            {'date': date, 'predicted_volume': volume}
+            for date, volume in zip(self._dates(snapshot, days_ahead), series.tolist())
+        ]
+
+    def iter_market_forecast(self, days_ahead=90, materials=None, regions=None, fields=None,
+                             daily_days=DAILY_PREDICTION_DAYS, snapshot=None):
+        """
+        Yield one record per selected (material, region) of snapshot
+        (default: the latest), like WasteSupplyForecaster.iter_market_forecast,
+        reading one series of the memory-mapped array at a time. The
+        selection is validated before the first record.
+        """
+        snapshot = snapshot or self.refresh()
+        if snapshot is None:
+            raise ValueError("No materialized forecast available")
+        materials = snapshot.meta['materials'] if materials is None else list(materials)
+        regions = snapshot.meta['regions'] if regions is None else list(regions)
+        fields = MARKET_FIELDS if fields is None else tuple(fields)
+        for name, values, known in (('materials', materials, snapshot.material_index),
+                                    ('regions', regions, snapshot.region_index),
+                                    ('fields', fields, MARKET_FIELDS)):
+            unknown = [value for value in values if value not in known]
+            if unknown:
+                raise ValueError(f"Unknown {name}: {', '.join(unknown)}")
+
+        daily_days = max(0, min(int(daily_days), days_ahead))
+        date_strings = self._dates(snapshot, daily_days)
+
+        def records():
+            for material in materials:
+                for region in regions:
+                    series = snapshot.volumes[snapshot.material_index[material], snapshot.region_index[region], :days_ahead]
+                    record = {'material': material, 'region': region}
+                    if 'total_volume_tons' in fields:
+                        record['total_volume_tons'] = round(float(series.sum()), 2)
+                    if 'daily_predictions' in fields:
+                        record['daily_predictions'] = [
+                            {'date': date, 'predicted_volume': volume}
+                            for date, volume in zip(date_strings, series[:daily_days].tolist())
+                        ]
+                    yield record
+        return records()
+
+    def get_market_forecast(self, days_ahead=90, snapshot=None, **selection):
+        """
+        Slice the horizon for the selected series of snapshot (default: the
+        latest); same shape and selection arguments as
+        WasteSupplyForecaster.get_market_forecast.
+        """
+        forecast = {}
+        for record in self.iter_market_forecast(days_ahead, snapshot=snapshot, **selection):
+            forecast.setdefault(record.pop('material'), {})[record.pop('region')] = record
+        return forecast
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Materialize forecasts for every material and region.')
+    parser.add_argument('--days', type=int, default=90, help='Horizon length in days')
+    parser.add_argument('--path', default=FORECASTS_DIR, help='Output directory')
+    args = parser.parse_args()
+
+    import ml_forecast
+    if not ml_forecast.wait_until_ready():
+        raise SystemExit(f"Forecaster failed to warm up: {ml_forecast.warm_up_state['error']}")
+    materialize_forecasts(ml_forecast.forecaster, args.path, args.days)
@@ -0,0 +1,122 @@
+"""
+Shared typed loader for Waste_Management_and_Recycling_India.csv.
+
+The CSV is parsed once into narrow columns: categoricals for the text
+columns, the smallest int dtype that fits for numbers, and the landfill
+"lat, long" string split into two float columns. The result is cached
+next to the CSV as an uncompressed NPZ sidecar, so utils and ml_forecast
+both load it in milliseconds. The sidecar (and the in-process copy) is
+rebuilt whenever the CSV's size or mtime changes.
+"""
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CSV_PATH = os.path.join(BASE_DIR, 'data', 'Waste_Management_and_Recycling_India.csv')
+SIDECAR_SUFFIX = '.columns.npz'
+
+# Bump whenever the parsed layout changes, so old sidecars are rebuilt
+FORMAT_VERSION = 1
+
+CATEGORICAL_COLUMNS = ('City/District', 'Waste Type', 'Disposal Method', 'Landfill Name')
+LOCATION_COLUMN = 'Landfill Location (Lat, Long)'
+LATITUDE_COLUMN = 'Landfill Latitude'
+LONGITUDE_COLUMN = 'Landfill Longitude'
+
+_frames = {}  # csv path -> (stamp, DataFrame)
+_lock = threading.Lock()
+
+
+def parse_csv(csv_path=CSV_PATH):
+    """
+    Parse the CSV into typed columns (no caching).
+    """
+    df = pd.read_csv(csv_path)
+    df.columns = [c.strip() for c in df.columns]
+
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+
+    if LOCATION_COLUMN in df.columns:
+        lat_long = df[LOCATION_COLUMN].str.split(',', n=1, expand=True)
+        position = df.columns.get_loc(LOCATION_COLUMN)
+        df = df.drop(columns=LOCATION_COLUMN)
+        df.insert(position, LATITUDE_COLUMN, pd.to_numeric(lat_long[0].str.strip()).astype(np.float32))
+        df.insert(position + 1, LONGITUDE_COLUMN, pd.to_numeric(lat_long[1].str.strip()).astype(np.float32))
+
+    for column in df.columns:
+        if pd.api.types.is_integer_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], downcast='integer')
+    return df
+
+
+def _sidecar_path(csv_path):
+    return f"{csv_path}{SIDECAR_SUFFIX}"
+
+
+def _write_sidecar(df, path, stamp):
+    arrays = {'stamp': np.array(stamp, dtype=np.int64), 'columns': np.array(df.columns, dtype=str)}
+    for i, column in enumerate(df.columns):
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            arrays[f'codes_{i}'] = values.cat.codes.to_numpy()
+            arrays[f'categories_{i}'] = np.asarray(values.cat.categories, dtype=str)
+        else:
+            arrays[f'values_{i}'] = values.to_numpy()
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"[DATA] Could not write {path}: {e}")
+
+
+def _read_sidecar(path, stamp):
+    """
+    The cached frame, or None if the sidecar is missing or stale.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            if tuple(data['stamp'].tolist()) != stamp:
+                return None
+            columns = {}
+            for i, column in enumerate(data['columns'].tolist()):
+                if f'codes_{i}' in data:
+                    columns[column] = pd.Categorical.from_codes(data[f'codes_{i}'], data[f'categories_{i}'])
+                else:
+                    columns[column] = data[f'values_{i}']
+            return pd.DataFrame(columns)
+    except Exception as e:
+        print(f"[DATA] Ignoring unreadable {path}: {e}")
+        return None
+
+
+def load_india_data(csv_path=CSV_PATH):
+    """
+    Typed frame of the India CSV, from memory or the binary sidecar when
+    the CSV is unchanged. Returns a copy, so callers may modify it.
+    """
+    stat = os.stat(csv_path)
+    stamp = (FORMAT_VERSION, stat.st_size, stat.st_mtime_ns)
+
+    cached = _frames.get(csv_path)
+    if cached is None or cached[0] != stamp:
+        with _lock:
+            cached = _frames.get(csv_path)
+            if cached is None or cached[0] != stamp:
+                sidecar = _sidecar_path(csv_path)
+                df = _read_sidecar(sidecar, stamp)
+                if df is None:
+                    df = parse_csv(csv_path)
+                    _write_sidecar(df, sidecar, stamp)
+                    print(f"[DATA] Parsed {os.path.basename(csv_path)} ({len(df)} rows)")
+                cached = _frames[csv_path] = (stamp, df)
+    return cached[1].copy()
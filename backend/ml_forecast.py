@@ -1,344 +1,1701 @@
 import numpy as np
 import pandas as pd
+import scipy.sparse
 from datetime import datetime, timedelta
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
 from sklearn.model_selection import train_test_split
+import hashlib
 import json
 import pickle
 import os
+import shutil
+import threading
+from collections import OrderedDict, namedtuple
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import india_data
+
+# Map CSV waste types to our material types
+WASTE_TYPE_MAP = {
+    'Plastic': ['PET', 'HDPE', 'PP'], # Split plastic into 3 types
+    'Organic': ['Paper'], # Use Organic trend as proxy for Paper
+    'E-Waste': ['Aluminum', 'Steel'], # Metals in E-waste
+    'Construction': ['Cardboard'], # Use Construction trend as proxy for Cardboard
+    'Hazardous': []
+}
+
+# Synthetic data: base volume per material in Tons Per Day for a major metro
+# (based on ~10% plastic composition of 10,000+ TPD total waste)
+SYNTHETIC_BASE_VOLUMES = {
+    'PET': 650,      # ~6-7% of total waste
+    'HDPE': 400,     # ~4%
+    'PP': 350,       # ~3.5%
+    'Aluminum': 150, # ~1.5%
+    'Steel': 200,    # ~2%
+    'Cardboard': 850,# ~8.5%
+    'Paper': 700     # ~7%
+}
+
+# Regional multipliers based on population/industrial activity
+SYNTHETIC_REGION_MULTIPLIERS = {
+    'Mumbai': 1.8,    # ~11,000+ TPD Total
+    'Delhi': 1.9,     # ~11,500+ TPD Total
+    'Bangalore': 1.2, # ~5,000 TPD
+    'Chennai': 1.1,   # ~5,000 TPD
+    'Kolkata': 1.0,   # ~4,500 TPD
+    'Hyderabad': 1.3  # ~6,000 TPD
+}
+
+# Month -> seasonal multiplier for festival seasons
+FESTIVAL_FACTORS = {
+    10: 1.3, 11: 1.3,  # Diwali season
+    3: 1.15, 4: 1.15   # Holi season
+}
+
+# Daily history interpolated from the yearly CSV figures
+HISTORY_START = datetime(2019, 1, 1)
+HISTORY_END = datetime(2023, 12, 31)
+
+DATA_COLUMNS = ['date', 'day_of_week', 'month', 'region', 'material_type', 'volume_tons']
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_CSV_PATH = india_data.CSV_PATH
+MODELS_DIR = os.path.join(BASE_DIR, 'models')
+TRAINING_DATA_PATH = os.path.join(BASE_DIR, 'data', 'training_waste_data.npz')
+
+# Bump whenever data preparation or feature code changes, so that cached
+# model artifacts trained on the old features are not reused
+FEATURE_VERSION = 3
+
+# Trailing row windows used for the prev_{w}day_avg model features
+ROLLING_WINDOWS = (7, 30)
+
+MODEL_PARAMS = {'n_estimators': 100, 'max_depth': 10}
+
+# Hyperparameters per forecasting engine, see WasteSupplyForecaster._make_model
+ENGINE_PARAMS = {
+    'random_forest': MODEL_PARAMS,
+    'hist_gradient_boosting': {'max_iter': 200, 'learning_rate': 0.1, 'max_leaf_nodes': 31},
+    'seasonal_linear': {}
+}
+
+# Engine used when WasteSupplyForecaster is created without one
+FORECAST_ENGINE = os.getenv('ML_FORECAST_ENGINE', 'random_forest')
+
+FEATURE_STORE_DIR = os.path.join(BASE_DIR, 'feature_store')
+
+# Forest size cap once incremental updates start adding warm-start trees
+MAX_TREES = 200
+
+# Window refits need at least this many rows for every material
+MIN_REFIT_ROWS = 100
+
+# Memory-map the FlatForest tree arrays instead of reading them into process memory
+MMAP_MODELS = os.getenv('ML_MMAP_MODELS', '1') != '0'
+
+# Total CPU budget for train_models (materials x trees)
+TRAIN_WORKERS = int(os.getenv('ML_TRAIN_WORKERS', os.cpu_count() or 1))
+
+# (prev_7day_avg, prev_30day_avg) for series missing from the state index
+DEFAULT_ROLLING_STATE = (50.0, 48.0)
+
+# How predict_future_supply rolls prev_7day_avg across the horizon
+PREDICTION_MODES = ('fixed', 'block', 'recursive')
+
+# Percentiles of the per-tree predictions reported as p{q} bands
+QUANTILES = (10, 50, 90)
+
+# Regions scored per pass by iter_market_forecast, bounding its working memory
+MARKET_STREAM_REGIONS = 256
+
+# Per-region values a market forecast can return, and the default daily window
+MARKET_FIELDS = ('total_volume_tons', 'daily_predictions')
+DAILY_PREDICTION_DAYS = 30
+
+def export_training_data(df, path=TRAINING_DATA_PATH):
+    """
+    Write a training frame as compressed columnar NPZ: strings are stored
+    as category codes + categories, dates as days since the epoch.
+    """
+    arrays = {}
+    for column in DATA_COLUMNS:
+        values = df[column]
+        if column == 'date':
+            arrays['date'] = pd.to_datetime(values, format='%Y-%m-%d').to_numpy().astype('datetime64[D]').astype(np.int32)
+        elif column in ('region', 'material_type'):
+            codes, categories = pd.factorize(values)
+            arrays[f'{column}_codes'] = codes.astype(np.int32)
+            arrays[f'{column}_categories'] = np.asarray(categories, dtype=str)
+        elif column in ('day_of_week', 'month'):
+            arrays[column] = values.to_numpy().astype(np.int8)
+        else:
+            arrays[column] = values.to_numpy(dtype=np.float64)
+    
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+    print(f"[ML] Training data saved to {path} ({os.path.getsize(path) / 2**20:.1f} MB)")
+
+def load_training_data(path=TRAINING_DATA_PATH):
+    """
+    Read a frame written by export_training_data. region, material_type and
+    date come back as categoricals, like generate_synthetic_data.
+    """
+    with np.load(path) as data:
+        day_numbers = data['date']
+        unique_days, day_codes = np.unique(day_numbers, return_inverse=True)
+        day_strings = np.datetime_as_string(unique_days.astype('datetime64[D]'))
+        return pd.DataFrame({
+            'date': pd.Categorical.from_codes(day_codes, day_strings),
+            'day_of_week': data['day_of_week'].astype(np.int64),
+            'month': data['month'].astype(np.int64),
+            'region': pd.Categorical.from_codes(data['region_codes'], data['region_categories']),
+            'material_type': pd.Categorical.from_codes(data['material_type_codes'], data['material_type_categories']),
+            'volume_tons': data['volume_tons']
+        })
+
+
+class FlatForest:
+    """
+    A fitted RandomForestRegressor exported as flat node arrays.
+    Saved as one raw binary file plus a small JSON layout, so
+    load(mmap=True) maps the arrays read-only and every server process
+    shares a single page-cache copy of the trees.
+    """
+    
+    # Field order in the binary file; leaves point both children at themselves
+    FIELDS = ('children', 'feature', 'threshold', 'value', 'roots')
+    
+    def __init__(self, children, feature, threshold, value, roots, max_depth):
+        self.children = children  # (2 * n_nodes,) interleaved left/right
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+    
+    @classmethod
+    def from_forest(cls, model):
+        sizes = [tree.tree_.node_count for tree in model.estimators_]
+        roots = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.int32)
+        n_nodes = sum(sizes)
+        children = np.empty((n_nodes, 2), dtype=np.int32)
+        feature = np.empty(n_nodes, dtype=np.int32)
+        threshold = np.empty(n_nodes, dtype=np.float64)
+        value = np.empty(n_nodes, dtype=np.float64)
+        for root, tree in zip(roots, model.estimators_):
+            t = tree.tree_
+            own = np.arange(t.node_count)
+            is_leaf = t.children_left < 0
+            span = slice(root, root + t.node_count)
+            children[span, 0] = root + np.where(is_leaf, own, t.children_left)
+            children[span, 1] = root + np.where(is_leaf, own, t.children_right)
+            feature[span] = np.where(is_leaf, 0, t.feature)
+            threshold[span] = t.threshold
+            value[span] = t.value[:, 0, 0]
+        max_depth = max(tree.tree_.max_depth for tree in model.estimators_)
+        return cls(children.ravel(), feature, threshold, value, roots, max_depth)
+    
+    @classmethod
+    def concat(cls, forests):
+        """
+        One forest holding the trees of all the given forests, in order.
+        """
+        offsets = np.cumsum([0] + [len(forest.feature) for forest in forests[:-1]])
+        return cls(
+            np.concatenate([np.asarray(f.children) + offset for f, offset in zip(forests, offsets)]).astype(np.int32),
+            np.concatenate([f.feature for f in forests]),
+            np.concatenate([f.threshold for f in forests]),
+            np.concatenate([f.value for f in forests]),
+            np.concatenate([np.asarray(f.roots) + offset for f, offset in zip(forests, offsets)]).astype(np.int32),
+            max(f.max_depth for f in forests)
+        )
+    
+    def last_trees(self, n_trees):
+        """
+        Forest of the newest n_trees trees (trees are stored back to back).
+        """
+        if n_trees >= len(self):
+            return self
+        first = len(self) - n_trees
+        start = int(self.roots[first])
+        return FlatForest(
+            (np.asarray(self.children[2 * start:]) - start).astype(np.int32),
+            self.feature[start:], self.threshold[start:], self.value[start:],
+            (np.asarray(self.roots[first:]) - start).astype(np.int32),
+            self.max_depth
+        )
+    
+    def save(self, prefix):
+        layout = {'max_depth': self.max_depth, 'fields': {}}
+        offset = 0
+        with open(f"{prefix}.bin", 'wb') as f:
+            for name in self.FIELDS:
+                array = np.ascontiguousarray(getattr(self, name))
+                layout['fields'][name] = {'dtype': array.dtype.str, 'offset': offset, 'length': len(array)}
+                f.write(array.tobytes())
+                offset += array.nbytes
+        with open(f"{prefix}.json", 'w') as f:
+            json.dump(layout, f)
+    
+    @classmethod
+    def load(cls, prefix, mmap=True):
+        with open(f"{prefix}.json") as f:
+            layout = json.load(f)
+        arrays = {}
+        for name, field in layout['fields'].items():
+            if mmap:
+                arrays[name] = np.memmap(f"{prefix}.bin", dtype=field['dtype'], mode='r',
+                                         offset=field['offset'], shape=(field['length'],))
+            else:
+                arrays[name] = np.fromfile(f"{prefix}.bin", dtype=field['dtype'],
+                                           count=field['length'], offset=field['offset'])
+        return cls(max_depth=layout['max_depth'], **arrays)
+    
+    def tree_predictions(self, X):
+        """
+        (n_trees, n_rows) predictions, walking all trees level by level.
+        X is compared in float32 like sklearn, so results match exactly.
+        """
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        row_offset = np.arange(len(X)) * X.shape[1]
+        X = X.ravel()
+        node = np.repeat(np.asarray(self.roots)[:, None], len(row_offset), axis=1)
+        for _ in range(self.max_depth):
+            go_right = X[row_offset + self.feature[node]] > self.threshold[node]
+            node = self.children[2 * node + go_right]
+        return self.value[node]
+    
+    def predict(self, X):
+        """
+        Mean over the trees, same as RandomForestRegressor.predict.
+        """
+        tree_predictions = self.tree_predictions(X)
+        return tree_predictions.sum(axis=0) / len(tree_predictions)
+    
+    def __len__(self):
+        return len(self.roots)
+
+
+class SeasonalLinearRegressor(RegressorMixin, BaseEstimator):
+    """
+    Additive day-of-week, month and region effects plus a linear term in
+    the rolling averages, fitted by least squares. Takes the same feature
+    columns as the forests; predicting is a gather and a dot per row.
+    """
+    
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=np.float64)
+        day_of_week, month, region = self._codes(X)
+        self.n_regions_ = int(region.max()) + 1
+        
+        # Sparse design: one-hot dow | month | region, then the two rolling averages
+        n_rows = len(X)
+        n_columns = 7 + 12 + self.n_regions_ + 2
+        rows = np.repeat(np.arange(n_rows), 5)
+        columns = np.column_stack((
+            day_of_week, 7 + month, 19 + region,
+            np.full(n_rows, n_columns - 2), np.full(n_rows, n_columns - 1)
+        )).ravel()
+        values = np.column_stack((np.ones((n_rows, 3)), X[:, 2:4])).ravel()
+        design = scipy.sparse.csr_matrix((values, (rows, columns)), shape=(n_rows, n_columns))
+        
+        # Normal equations are tiny (n_columns^2); lstsq handles the collinear one-hot blocks
+        coef = np.linalg.lstsq(
+            (design.T @ design).toarray(), design.T @ np.asarray(y, dtype=np.float64), rcond=None
+        )[0]
+        self.day_of_week_effect_ = coef[:7]
+        self.month_effect_ = coef[7:19]
+        self.region_effect_ = coef[19:19 + self.n_regions_]
+        self.rolling_coef_ = coef[-2:]
+        return self
+    
+    def _codes(self, X):
+        return X[:, 0].astype(np.int64), X[:, 1].astype(np.int64) - 1, X[:, 4]
+    
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        day_of_week, month, region = self._codes(X)
+        # Regions unseen in training get the average region effect
+        known = (region >= 0) & (region < self.n_regions_)
+        region_term = np.full(len(X), self.region_effect_.mean())
+        region_term[known] = self.region_effect_[region[known].astype(np.int64)]
+        return (self.day_of_week_effect_[day_of_week] + self.month_effect_[month]
+                + region_term + X[:, 2:4] @ self.rolling_coef_)
+
+
+class FeatureStore:
+    """
+    Append-only store of prepared observations for incremental updates.
+    Every ingest is written as its own segment, and the last
+    max(ROLLING_WINDOWS) rows of each series are kept as its tail, so new
+    observations only need their own series' tails to compute features.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.state = {'segments': [], 'model_version': None, 'updates': 0}
+        self._tails = None
+        if self.exists():
+            with open(self._state_path) as f:
+                self.state = json.load(f)
+    
+    @property
+    def _state_path(self):
+        return os.path.join(self.path, 'state.json')
+    
+    @property
+    def _tails_path(self):
+        return os.path.join(self.path, 'tails.pkl')
+    
+    def exists(self):
+        return os.path.exists(self._state_path)
+    
+    @property
+    def tails(self):
+        if self._tails is None:
+            self._tails = {}
+            if os.path.exists(self._tails_path):
+                with open(self._tails_path, 'rb') as f:
+                    self._tails = pickle.load(f)
+        return self._tails
+    
+    def _write_segment(self, rows):
+        os.makedirs(os.path.join(self.path, 'segments'), exist_ok=True)
+        name = f"segments/{len(self.state['segments']):06d}.pkl"
+        rows.to_pickle(os.path.join(self.path, name))
+        self.state['segments'].append({
+            'file': name,
+            'rows': len(rows),
+            'min_date': rows['date'].min(),
+            'max_date': rows['date'].max()
+        })
+    
+    def _update_tails(self, rows):
+        tail_length = max(ROLLING_WINDOWS)
+        for series, series_rows in rows.groupby(['region', 'material_type'], sort=False):
+            previous = self.tails.get(series)
+            combined = series_rows if previous is None else pd.concat([previous, series_rows])
+            self.tails[series] = combined[DATA_COLUMNS].sort_values('date').tail(tail_length)
+    
+    def save(self):
+        # Both files are swapped in whole, so readers never see a partial write
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = f"{self._tails_path}.tmp{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self.tails, f)
+        os.replace(tmp_path, self._tails_path)
+        self.save_state()
+    
+    def save_state(self):
+        """
+        Write state.json only (segments, model version, update count).
+        """
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = f"{self._state_path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self._state_path)
+    
+    def initialize(self, featured_df):
+        """
+        Seed the store with the full prepared training history (done once).
+        """
+        self._tails = {}
+        self._write_segment(featured_df)
+        self._update_tails(featured_df)
+        self.save()
+    
+    def tail_rows(self, series_keys):
+        """
+        Stored tail rows for the given (region, material) series.
+        """
+        tails = [self.tails[key] for key in series_keys if key in self.tails]
+        return pd.concat(tails) if tails else pd.DataFrame(columns=DATA_COLUMNS)
+    
+    def append(self, featured_rows):
+        self._write_segment(featured_rows)
+        self._update_tails(featured_rows)
+        self.save()
+    
+    def load_window(self, since_date):
+        """
+        All stored rows dated on or after since_date ('%Y-%m-%d'), reading
+        only the segments that overlap the window.
+        """
+        frames = []
+        for segment in self.state['segments']:
+            if segment['max_date'] >= since_date:
+                rows = pd.read_pickle(os.path.join(self.path, segment['file']))
+                frames.append(rows[rows['date'] >= since_date])
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=DATA_COLUMNS)
+
+
+# Everything predictions read together. Never modified: updates build a new
+# one and swap it in with a single assignment (see WasteSupplyForecaster.serving)
+ServingModels = namedtuple('ServingModels', ['models', 'series_state', 'fallback_codes', 'series_models'])
+
+# Serializes ingest_observations (feature store writes and model updates)
+_ingest_lock = threading.Lock()
+
 
 class WasteSupplyForecaster:
     """
     ML-based forecasting system for recycled material supply.
-    Uses Random Forest to predict future material volumes.
+    Predicts future material volumes with one model per material, built
+    by the selected engine (see ENGINE_PARAMS; default Random Forest).
     """
     
-    def __init__(self):
-        self.models = {}  # One model per material type
+    def __init__(self, engine=None):
+        self.engine = engine or FORECAST_ENGINE
+        if self.engine not in ENGINE_PARAMS:
+            raise ValueError(f"Unknown forecasting engine: {self.engine}")
+        self.serving = ServingModels(
+            models={},  # One model per material type
+            series_state={},  # material -> region -> latest rolling state, see build_series_state
+            fallback_codes={},  # region -> sorted-position code for series missing from series_state
+            series_models={}  # material -> region -> FlatForest of trees added by warm-start ingests
+        )
         self.material_types = ['PET', 'HDPE', 'PP', 'Aluminum', 'Steel', 'Cardboard', 'Paper']
         self.regions = ['Mumbai', 'Delhi', 'Bangalore', 'Chennai', 'Kolkata', 'Hyderabad']
+        self.random_state = 42  # Seeds interpolation noise and the forests
+        self.type_map = WASTE_TYPE_MAP  # CSV waste type -> material types
+        self.history_start = HISTORY_START
+        self.history_end = HISTORY_END
+        self.model_version = None  # Artifact key of the currently loaded models
+        self.base_version = None  # Version whose directory holds the model files (see save_models)
+        self.model_generation = 0  # Bumped whenever the in-memory models change
+        self.training_report = {}  # Per-material R² and fit time from the last training
         
-    def load_real_data(self):
+    @property
+    def models(self):
+        return self.serving.models
+    
+    @property
+    def series_state(self):
+        return self.serving.series_state
+    
+    @property
+    def fallback_codes(self):
+        return self.serving.fallback_codes
+    
+    @property
+    def series_models(self):
+        return self.serving.series_models
+    
+    def load_real_data(self, vectorized=True, csv_path=DATA_CSV_PATH):
         """
         Load real historical data (2019-2023) from CSV and interpolate to daily.
+        The vectorized path builds the whole region x material x day frame in
+        bulk; vectorized=False keeps the original per-day loop for comparison.
         """
         print(f"[ML] Loading real data from CSV...")
         try:
-            csv_path = os.path.join(os.path.dirname(__file__), 'data', 'Waste_Management_and_Recycling_India.csv')
             if not os.path.exists(csv_path):
                 print("[ML] Single real data CSV not found, generating synthetic.")
                 return self.generate_synthetic_data()
                 
-            df = pd.read_csv(csv_path)
-            df.columns = [c.strip() for c in df.columns]
-            
-            data = []
+            df = india_data.load_india_data(csv_path)
             
             # Process each city as a "region"
-            # We will map specific waste types to our material types
-            type_map = {
-                'Plastic': ['PET', 'HDPE', 'PP'], # Split plastic into 3 types
-                'Organic': ['Paper'], # Use Organic trend as proxy for Paper
-                'E-Waste': ['Aluminum', 'Steel'], # Metals in E-waste
-                'Construction': ['Cardboard'], # Use Construction trend as proxy for Cardboard
-                'Hazardous': []
-            }
-            
-            # Only process cities that are in our target list, or expand list?
-            # Let's expand regions to include all cities in CSV if possible, or just the top ones.
-            # Forecaster init has self.regions. Let's update that dynamically or filter.
-            # Using specific cities for now to match UI dropdowns roughly
+            # Using every city in the CSV so the regions match the UI dropdowns
             target_cities = df['City/District'].unique()
             self.regions = list(target_cities) # Update regions to match CSV
             
-            for city in self.regions:
-                city_df = df[df['City/District'] == city]
-                
-                # We need to interpolate yearly points to daily
-                # Years: 2019, 2020, 2021, 2022, 2023
-                
-                for waste_type, materials in type_map.items():
-                    if not materials: continue
-                    
-                    type_rows = city_df[city_df['Waste Type'] == waste_type].sort_values('Year')
-                    if type_rows.empty: continue
-                    
-                    # Get yearly TPD
-                    yearly_tpd = type_rows.set_index('Year')['Waste Generated (Tons/Day)'].to_dict()
-                    
-                    start_date = datetime(2019, 1, 1)
-                    end_date = datetime(2023, 12, 31)
-                    delta_days = (end_date - start_date).days
-                    
-                    for i in range(delta_days + 1):
-                        current_date = start_date + timedelta(days=i)
-                        year = current_date.year
-                        month = current_date.month
-                        day_of_week = current_date.weekday()
-                        
-                        # Get baseline TPD for this year (interpolate ideally, but step is okay for now)
-                        # Or linear interpolation between years
-                        val_curr = yearly_tpd.get(year, 0)
-                        val_next = yearly_tpd.get(year + 1, val_curr)
-                        
-                        # Fraction of year passed
-                        day_of_year = current_date.timetuple().tm_yday
-                        alpha = day_of_year / 365.0
-                        interpolated_tpd = val_curr + (val_next - val_curr) * alpha
-                        
-                        # Seasonality & Noise
-                        weekly_factor = 1.1 if day_of_week >= 5 else 0.95
-                        seasonal_factor = 1.0 + 0.1 * np.sin(2 * np.pi * day_of_year / 365) # Simple wave
-                        
-                        daily_total_material = interpolated_tpd * weekly_factor * seasonal_factor
-                        
-                        # Distribute among sub-materials (e.g. Plastic -> PET, HDPE, PP)
-                        # Assume even split for simplicity or ratios
-                        split_ratio = 1.0 / len(materials)
-                        
-                        for mat in materials:
-                            vol = daily_total_material * split_ratio
-                            # Add noise
-                            vol += np.random.normal(0, vol * 0.05)
-                            
-                            data.append({
-                                'date': current_date.strftime('%Y-%m-%d'),
-                                'day_of_week': day_of_week,
-                                'month': month,
-                                'region': city,
-                                'material_type': mat,
-                                'volume_tons': round(max(0, vol), 2)
-                            })
+            if vectorized:
+                data = self._interpolate_daily(df)
+            else:
+                data = self._interpolate_daily_loop(df)
                             
             print(f"[ML] Loaded and interpolated {len(data)} real data points.")
-            return pd.DataFrame(data)
+            return data
             
         except Exception as e:
             print(f"[ML] Error loading real data: {e}")
             return self.generate_synthetic_data()
 
-    def generate_synthetic_data(self, days=180):
+    def _interpolate_daily(self, df):
         """
-        Generate 6 months of synthetic waste collection data.
-        Includes seasonal patterns, weekly cycles, and regional variations.
+        Interpolate yearly TPD to daily volumes for every (region, material)
+        with array operations. Rows come out in the same order as the loop
+        path and draw the same seeded noise.
         """
-        print(f"[ML] Generating {days} days of synthetic data...")
+        rng = np.random.default_rng(self.random_state)
+        
+        dates = pd.date_range(self.history_start, self.history_end, freq='D')
+        n_days = len(dates)
+        years = dates.year.to_numpy()
+        day_of_week = dates.dayofweek.to_numpy().astype(np.int64)
+        day_of_year = dates.dayofyear.to_numpy()
+        date_strings = dates.strftime('%Y-%m-%d').to_numpy()
+        
+        # Yearly TPD per (city, waste type), with one extra year so that the
+        # last year interpolates flat like yearly_tpd.get(year + 1, val_curr)
+        year_cols = np.arange(self.history_start.year, self.history_end.year + 2)
+        yearly = df.pivot_table(
+            index=['City/District', 'Waste Type'], columns='Year',
+            values='Waste Generated (Tons/Day)', aggfunc='last'
+        ).reindex(columns=year_cols)
+        
+        # Series in loop order: city, then waste type in WASTE_TYPE_MAP order
+        series_index = pd.MultiIndex.from_tuples(
+            [(city, waste_type) for city in self.regions
+             for waste_type, materials in self.type_map.items() if materials]
+        )
+        yearly = yearly.reindex(series_index).dropna(how='all')
+        if yearly.empty:
+            return pd.DataFrame(columns=DATA_COLUMNS)
+        tpd = yearly.to_numpy(dtype=float)
+        
+        year_pos = years - year_cols[0]
+        val_curr = np.nan_to_num(tpd[:, year_pos])  # (series, day)
+        val_next = tpd[:, year_pos + 1]
+        val_next = np.where(np.isnan(val_next), val_curr, val_next)
+        
+        alpha = day_of_year / 365.0
+        interpolated_tpd = val_curr + (val_next - val_curr) * alpha
+        
+        weekly_factor = np.where(day_of_week >= 5, 1.1, 0.95)
+        seasonal_factor = 1.0 + 0.1 * np.sin(2 * np.pi * day_of_year / 365)
+        daily_total_material = interpolated_tpd * weekly_factor * seasonal_factor
+        
+        # Expand each series into its sub-materials: rows ordered by
+        # (series, day, material) exactly like the nested loop
+        series_cities = yearly.index.get_level_values(0).to_numpy()
+        series_types = yearly.index.get_level_values(1)
+        sub_counts = np.array([len(self.type_map[t]) for t in series_types])
+        sub_materials = np.concatenate([self.type_map[t] for t in series_types])
+        sub_series = np.repeat(np.arange(len(yearly)), sub_counts)
         
+        row_sub = np.repeat(np.arange(len(sub_series)), n_days)
+        row_day = np.tile(np.arange(n_days), len(sub_series))
+        order = np.lexsort((row_sub, row_day, sub_series[row_sub]))
+        row_sub = row_sub[order]
+        row_day = row_day[order]
+        row_series = sub_series[row_sub]
+        
+        split_ratio = 1.0 / sub_counts[row_series]
+        vol = daily_total_material[row_series, row_day] * split_ratio
+        vol += vol * 0.05 * rng.standard_normal(len(vol))
+        
+        return pd.DataFrame({
+            'date': date_strings[row_day],
+            'day_of_week': day_of_week[row_day],
+            'month': dates.month.to_numpy().astype(np.int64)[row_day],
+            'region': series_cities[row_series],
+            'material_type': sub_materials[row_sub],
+            'volume_tons': np.round(np.maximum(vol, 0), 2)
+        })
+
+    def _interpolate_daily_loop(self, df):
+        """
+        Original day-by-day interpolation, kept as the reference the
+        vectorized path is benchmarked against.
+        """
+        rng = np.random.default_rng(self.random_state)
         data = []
-        start_date = datetime.now() - timedelta(days=days)
         
-        for day in range(days):
-            current_date = start_date + timedelta(days=day)
-            day_of_week = current_date.weekday()
-            month = current_date.month
+        for city in self.regions:
+            city_df = df[df['City/District'] == city]
             
-            for region in self.regions:
-                # Fallback to default material types if not set?
-                # Actually self.regions matches UI, so we must support all self.material_types
-                pass
-                for material in self.material_types:
-                    # Base volume with realistic city-scale data (approx. Tons Per Day for a major metro)
-                    # Based on ~10% plastic composition of 10,000+ TPD total waste
-                    base_volume = {
-                        'PET': 650,      # ~6-7% of total waste
-                        'HDPE': 400,     # ~4%
-                        'PP': 350,       # ~3.5%
-                        'Aluminum': 150, # ~1.5%
-                        'Steel': 200,    # ~2%
-                        'Cardboard': 850,# ~8.5%
-                        'Paper': 700     # ~7%
-                    }[material]
+            # We need to interpolate yearly points to daily
+            # Years: 2019, 2020, 2021, 2022, 2023
+            
+            for waste_type, materials in self.type_map.items():
+                if not materials: continue
+                
+                type_rows = city_df[city_df['Waste Type'] == waste_type].sort_values('Year')
+                if type_rows.empty: continue
+                
+                # Get yearly TPD
+                yearly_tpd = type_rows.set_index('Year')['Waste Generated (Tons/Day)'].to_dict()
+                
+                delta_days = (self.history_end - self.history_start).days
+                
+                for i in range(delta_days + 1):
+                    current_date = self.history_start + timedelta(days=i)
+                    year = current_date.year
+                    month = current_date.month
+                    day_of_week = current_date.weekday()
                     
-                    # Regional multipliers based on population/industrial activity
-                    region_multiplier = {
-                        'Mumbai': 1.8,    # ~11,000+ TPD Total
-                        'Delhi': 1.9,     # ~11,500+ TPD Total
-                        'Bangalore': 1.2, # ~5,000 TPD
-                        'Chennai': 1.1,   # ~5,000 TPD
-                        'Kolkata': 1.0,   # ~4,500 TPD
-                        'Hyderabad': 1.3  # ~6,000 TPD
-                    }[region]
+                    # Linear interpolation between years
+                    val_curr = yearly_tpd.get(year, 0)
+                    val_next = yearly_tpd.get(year + 1, val_curr)
                     
-                    # Weekly pattern (more waste on weekends)
-                    weekly_factor = 1.2 if day_of_week >= 5 else 1.0
+                    # Fraction of year passed
+                    day_of_year = current_date.timetuple().tm_yday
+                    alpha = day_of_year / 365.0
+                    interpolated_tpd = val_curr + (val_next - val_curr) * alpha
                     
-                    # Seasonal pattern (festivals, holidays)
-                    seasonal_factor = 1.0
-                    if month in [10, 11]:  # Diwali season
-                        seasonal_factor = 1.3
-                    elif month in [3, 4]:  # Holi season
-                        seasonal_factor = 1.15
+                    # Seasonality & Noise
+                    weekly_factor = 1.1 if day_of_week >= 5 else 0.95
+                    seasonal_factor = 1.0 + 0.1 * np.sin(2 * np.pi * day_of_year / 365) # Simple wave
                     
-                    # Calculate volume with noise
-                    volume = base_volume * region_multiplier * weekly_factor * seasonal_factor
-                    volume += np.random.normal(0, volume * 0.1)  # 10% noise
-                    volume = max(0, volume)  # No negative volumes
+                    daily_total_material = interpolated_tpd * weekly_factor * seasonal_factor
                     
-                    data.append({
-                        'date': current_date.strftime('%Y-%m-%d'),
-                        'day_of_week': day_of_week,
-                        'month': month,
-                        'region': region,
-                        'material_type': material,
-                        'volume_tons': round(volume, 2)
-                    })
-        
-        df = pd.DataFrame(data)
+                    # Distribute among sub-materials (e.g. Plastic -> PET, HDPE, PP)
+                    # Assume even split for simplicity or ratios
+                    split_ratio = 1.0 / len(materials)
+                    
+                    for mat in materials:
+                        vol = daily_total_material * split_ratio
+                        # Add noise
+                        vol += vol * 0.05 * rng.standard_normal()
+                        
+                        data.append({
+                            'date': current_date.strftime('%Y-%m-%d'),
+                            'day_of_week': day_of_week,
+                            'month': month,
+                            'region': city,
+                            'material_type': mat,
+                            'volume_tons': round(max(0, vol), 2)
+                        })
+        
+        return pd.DataFrame(data, columns=DATA_COLUMNS)
+
+    def generate_synthetic_data(self, days=180, regions=None, materials=None, base_volumes=None,
+                                region_multipliers=None, festival_factors=None, weekend_factor=1.2,
+                                noise=0.1, start_date=None):
+        """
+        Generate synthetic waste collection data (default: 6 months).
+        Includes seasonal patterns, weekly cycles, and regional variations.
+        
+        Built as one (day, region, material) array, so it scales to millions
+        of rows for any region/material sets. Regions and materials missing
+        from the multiplier/base tables default to 1.0 and the mean base
+        volume. festival_factors maps month -> seasonal multiplier.
+        region and material_type come back as categoricals.
+        """
+        regions = list(self.regions if regions is None else regions)
+        materials = list(self.material_types if materials is None else materials)
+        base_volumes = SYNTHETIC_BASE_VOLUMES if base_volumes is None else base_volumes
+        region_multipliers = SYNTHETIC_REGION_MULTIPLIERS if region_multipliers is None else region_multipliers
+        festival_factors = FESTIVAL_FACTORS if festival_factors is None else festival_factors
+        print(f"[ML] Generating {days} days of synthetic data for {len(regions)} regions x {len(materials)} materials...")
+        
+        rng = np.random.default_rng(self.random_state)
+        start = pd.Timestamp(start_date or datetime.now() - timedelta(days=days)).normalize()
+        dates = pd.date_range(start, periods=days, freq='D')
+        day_of_week = dates.dayofweek.to_numpy().astype(np.int64)
+        month = dates.month.to_numpy().astype(np.int64)
+        
+        default_base = np.mean(list(base_volumes.values()))
+        base = np.array([base_volumes.get(m, default_base) for m in materials], dtype=float)
+        multiplier = np.array([region_multipliers.get(r, 1.0) for r in regions], dtype=float)
+        
+        # Weekly pattern (more waste on weekends) x seasonal pattern (festivals, holidays)
+        month_factor = np.ones(13)
+        for festival_month, factor in festival_factors.items():
+            month_factor[festival_month] = factor
+        day_factor = np.where(day_of_week >= 5, weekend_factor, 1.0) * month_factor[month]
+        
+        # Volume with noise, shaped (day, region, material) like the original nested loops
+        volume = day_factor[:, None, None] * multiplier[None, :, None] * base[None, None, :]
+        volume += volume * noise * rng.standard_normal(volume.shape)
+        np.maximum(volume, 0, out=volume)  # No negative volumes
+        
+        n_days, n_regions, n_materials = volume.shape
+        cells = n_regions * n_materials
+        df = pd.DataFrame({
+            'date': pd.Categorical.from_codes(np.repeat(np.arange(n_days), cells), dates.strftime('%Y-%m-%d')),
+            'day_of_week': np.repeat(day_of_week, cells),
+            'month': np.repeat(month, cells),
+            'region': pd.Categorical.from_codes(np.tile(np.repeat(np.arange(n_regions), n_materials), n_days), regions),
+            'material_type': pd.Categorical.from_codes(np.tile(np.arange(n_materials), n_days * n_regions), materials),
+            'volume_tons': np.round(volume.ravel(), 2)
+        })
         print(f"[ML] Generated {len(df)} data points")
         return df
     
-    def prepare_features(self, df):
+    def prepare_features(self, df, windows=ROLLING_WINDOWS, lags=(), same_day_last_year=False):
         """
         Create features for ML model.
+        
+        Rolling means are computed from one cumulative sum over all series
+        sorted by (region, material, date), so no Python code runs per
+        series. Adds prev_{w}day_avg for each window, lag_{k}day for each
+        lag and optionally same_day_last_year (NaN where no history exists).
         """
-        # Add rolling averages
-        df = df.sort_values('date')
-        df['prev_7day_avg'] = df.groupby(['region', 'material_type'])['volume_tons'].transform(
-            lambda x: x.rolling(window=7, min_periods=1).mean()
-        )
-        df['prev_30day_avg'] = df.groupby(['region', 'material_type'])['volume_tons'].transform(
-            lambda x: x.rolling(window=30, min_periods=1).mean()
-        )
+        dates = pd.to_datetime(df['date'], format='%Y-%m-%d').to_numpy()
+        region_codes = pd.factorize(df['region'])[0]
+        material_codes = pd.factorize(df['material_type'])[0]
         
-        return df
+        # Series-major order, dates ascending within each series
+        order = np.lexsort((dates, material_codes, region_codes))
+        series_id = region_codes[order] * (material_codes.max() + 1) + material_codes[order]
+        sorted_dates = dates[order]
+        volume = df['volume_tons'].to_numpy(dtype=float)[order]
+        
+        n_rows = len(volume)
+        new_series = np.ones(n_rows, dtype=bool)
+        new_series[1:] = series_id[1:] != series_id[:-1]
+        series_start = np.maximum.accumulate(np.where(new_series, np.arange(n_rows), 0))
+        position = np.arange(n_rows)
+        
+        cumsum = np.concatenate(([0.0], np.cumsum(volume)))
+        features = {}
+        for window in windows:
+            # Trailing mean over up to `window` rows, like rolling(min_periods=1)
+            window_start = np.maximum(series_start, position - window + 1)
+            features[f'prev_{window}day_avg'] = (cumsum[position + 1] - cumsum[window_start]) / (position + 1 - window_start)
+        
+        for lag in lags:
+            lagged = np.full(n_rows, np.nan)
+            has_lag = position - lag >= series_start
+            lagged[has_lag] = volume[position[has_lag] - lag]
+            features[f'lag_{lag}day'] = lagged
+        
+        if same_day_last_year:
+            # Look up (series, date - 1 year) in the sorted (series, date) keys
+            day_number = sorted_dates.astype('datetime64[D]').astype(np.int64)
+            last_year = (pd.DatetimeIndex(sorted_dates) - pd.DateOffset(years=1)).to_numpy()
+            last_year_number = last_year.astype('datetime64[D]').astype(np.int64)
+            span = day_number.max() - min(day_number.min(), last_year_number.min()) + 1
+            keys = series_id * span + (day_number - day_number.min())
+            target = series_id * span + (last_year_number - day_number.min())
+            match = np.searchsorted(keys, target).clip(max=n_rows - 1)
+            features['same_day_last_year'] = np.where(keys[match] == target, volume[match], np.nan)
+        
+        # Scatter back to the caller's row order, then sort by date
+        df = df.copy()
+        for name, values in features.items():
+            column = np.empty(n_rows)
+            column[order] = values
+            df[name] = column
+        return df.iloc[np.argsort(dates, kind='stable')]
+    
+    def _make_model(self, tree_jobs=1):
+        """
+        Unfitted model for the forecaster's engine.
+        """
+        params = ENGINE_PARAMS[self.engine]
+        if self.engine == 'random_forest':
+            # Trees are seeded up front, so n_jobs does not change the result
+            return RandomForestRegressor(random_state=self.random_state, n_jobs=tree_jobs, **params)
+        if self.engine == 'hist_gradient_boosting':
+            return HistGradientBoostingRegressor(random_state=self.random_state, **params)
+        return SeasonalLinearRegressor(**params)
+    
+    def _train_material(self, material_data, material, tree_jobs=1):
+        """
+        Fit and score one material's model. Returns (model, report).
+        """
+        start = time.perf_counter()
+        material_data = material_data.copy()
+        
+        # Features
+        X = material_data[['day_of_week', 'month', 'prev_7day_avg', 'prev_30day_avg']].copy()
+        # Encode region as its position among the sorted region names, as
+        # build_series_state does (categorical inputs keep their own order)
+        regions = sorted(set(material_data['region']))
+        X['region'] = pd.Categorical(np.asarray(material_data['region'], dtype=object), categories=regions).codes
+        
+        # Target
+        y = material_data['volume_tons']
+        
+        # Non-forest engines are fitted on plain arrays, as _predict_rows scores them
+        if self.engine != 'random_forest':
+            X = X.to_numpy(dtype=np.float64)
+        
+        # Train/test split
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        
+        # Train model
+        model = self._make_model(tree_jobs)
+        model.fit(X_train, y_train)
+        
+        # Evaluate
+        train_score = model.score(X_train, y_train)
+        test_score = model.score(X_test, y_test)
+        if isinstance(model, RandomForestRegressor):
+            # Forests are served as flat node arrays, scored level by level
+            model = FlatForest.from_forest(model)
+        
+        elapsed = time.perf_counter() - start
+        print(f"[ML] {material}: Train R² = {train_score:.3f}, Test R² = {test_score:.3f} ({elapsed:.1f}s)")
+        
+        return model, {'train_r2': train_score, 'test_r2': test_score, 'seconds': elapsed}
     
-    def train_models(self, df):
+    def train_models(self, df, n_jobs=None):
         """
-        Train Random Forest models for each material type.
+        Train one model per material type with the forecaster's engine.
+        
+        n_jobs is the total CPU budget (default ML_TRAIN_WORKERS, else all
+        cores). Materials are fitted concurrently and any remaining budget is
+        spread over each forest's trees; for a fixed seed the models are
+        identical to serial training (n_jobs=1).
         """
-        print("[ML] Training Random Forest models...")
+        n_jobs = n_jobs or TRAIN_WORKERS
+        material_workers = max(1, min(n_jobs, len(self.material_types)))
+        tree_jobs = max(1, n_jobs // material_workers)
+        print(f"[ML] Training {self.engine} models ({material_workers} materials x {tree_jobs} tree jobs)...")
+        start = time.perf_counter()
         
         df = self.prepare_features(df)
+        by_material = dict(tuple(df.groupby('material_type', sort=False, observed=True)))
         
-        for material in self.material_types:
-            material_data = df[df['material_type'] == material].copy()
-            
-            # Features
-            X = material_data[['day_of_week', 'month', 'prev_7day_avg', 'prev_30day_avg']]
-            # Encode region as numeric
-            material_data['region_encoded'] = pd.Categorical(material_data['region']).codes
-            X['region'] = material_data['region_encoded']
-            
-            # Target
-            y = material_data['volume_tons']
-            
-            # Train/test split
-            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-            
-            # Train model
-            model = RandomForestRegressor(n_estimators=100, random_state=42, max_depth=10)
-            model.fit(X_train, y_train)
-            
-            # Evaluate
-            train_score = model.score(X_train, y_train)
-            test_score = model.score(X_test, y_test)
-            
-            print(f"[ML] {material}: Train R² = {train_score:.3f}, Test R² = {test_score:.3f}")
-            
-            self.models[material] = model
+        # Tree building releases the GIL, so threads give real parallelism here
+        with ThreadPoolExecutor(max_workers=material_workers) as pool:
+            futures = {
+                material: pool.submit(self._train_material, by_material[material], material, tree_jobs)
+                for material in self.material_types if material in by_material
+            }
+            results = {material: future.result() for material, future in futures.items()}
+        
+        models = dict(self.models)
+        self.training_report = {}
+        for material, (model, report) in results.items():
+            models[material] = model
+            self.training_report[material] = report
+        self.serving = ServingModels(models, self.build_series_state(df), self.build_fallback_codes(), {})
         
-        print("[ML] All models trained successfully!")
+        self.model_version = self.base_version = None  # Not stored as an artifact until saved
+        self.model_generation += 1
+        print(f"[ML] All models trained successfully in {time.perf_counter() - start:.1f}s!")
     
-    def predict_future_supply(self, material_type, region, days_ahead=30):
+    def _horizon_calendar(self, days_ahead, start_date=None):
+        """
+        Calendar features for every day of the forecast horizon.
+        Returns (date strings, day_of_week, month) arrays.
+        """
+        start = pd.Timestamp(start_date or datetime.now()).normalize()
+        dates = pd.date_range(start, periods=days_ahead, freq='D')
+        return (
+            dates.strftime('%Y-%m-%d').to_numpy(),
+            dates.dayofweek.to_numpy(),
+            dates.month.to_numpy()
+        )
+    
+    def _tree_predictions(self, model, X):
+        """
+        Per-tree predictions for a feature matrix as one (n_trees, n_rows)
+        array, walking all trees level by level (see FlatForest). Trained
+        and loaded forests are already flat; an sklearn forest passed in
+        directly is converted first.
+        """
+        if isinstance(model, RandomForestRegressor):
+            model = FlatForest.from_forest(model)
+        return model.tree_predictions(X)
+    
+    def _predict_rows(self, model, X):
+        """
+        Predictions for a feature matrix (same result as model.predict);
+        forests are averaged over their per-tree predictions.
+        """
+        if not isinstance(model, (FlatForest, RandomForestRegressor)):
+            return model.predict(X)
+        tree_predictions = self._tree_predictions(model, X)
+        return tree_predictions.sum(axis=0) / len(tree_predictions)
+    
+    def build_series_state(self, featured_df):
+        """
+        Index of the latest rolling state per (material, region), taken from
+        the last prepared row of each series, plus the region code the
+        material's model was trained with. Built once after training.
+        """
+        last_rows = featured_df.sort_values('date', kind='stable').groupby(
+            ['material_type', 'region'], sort=False, observed=True
+        ).tail(1)
+        
+        series_state = {}
+        for material, rows in last_rows.groupby('material_type', sort=False, observed=True):
+            # Same sorted encoding as _train_material
+            region_codes = {region: code for code, region in enumerate(sorted(rows['region']))}
+            series_state[material] = {
+                row.region: {
+                    'code': region_codes[row.region],
+                    'date': row.date,
+                    'prev_7day_avg': float(row.prev_7day_avg),
+                    'prev_30day_avg': float(row.prev_30day_avg)
+                }
+                for row in rows.itertuples()
+            }
+        return series_state
+    
+    def build_fallback_codes(self):
+        """
+        Region codes by sorted position in self.regions, for series missing
+        from the state index. Built with the index, so seeding is a lookup.
+        """
+        return {region: code for code, region in enumerate(sorted(self.regions))}
+    
+    def _series_seed(self, material, regions, serving=None):
+        """
+        Region codes and starting rolling averages for each region, looked
+        up in the series state index (placeholders for unknown series).
+        """
+        serving = serving or self.serving
+        states = serving.series_state.get(material, {})
+        fallback_codes = serving.fallback_codes
+        codes = np.empty(len(regions))
+        prev_7day_avg = np.empty(len(regions))
+        prev_30day_avg = np.empty(len(regions))
+        for i, region in enumerate(regions):
+            state = states.get(region)
+            if state is None:
+                codes[i] = fallback_codes.get(region, 0)
+                prev_7day_avg[i], prev_30day_avg[i] = DEFAULT_ROLLING_STATE
+            else:
+                codes[i] = state['code']
+                prev_7day_avg[i] = state['prev_7day_avg']
+                prev_30day_avg[i] = state['prev_30day_avg']
+        return codes, prev_7day_avg, prev_30day_avg
+    
+    def _predict_horizon(self, material, regions, day_of_week, month, mode='block', block_size=7, quantiles=None):
+        """
+        Predict every region x horizon day for one material model.
+        Builds a single (regions, days, features) matrix and scores it in
+        bulk according to the prediction mode. Returns a (regions, days) array.
+        
+        With quantiles (percentiles, e.g. QUANTILES) the per-tree outputs of
+        each block are kept in one (trees, regions, days) array and the
+        percentiles are taken over it in a single call; returns
+        (predicted, bands) with bands shaped (quantiles, regions, days).
+        Only forest engines have per-tree outputs.
+        
+        Regions with warm-start trees (series_models) are averaged over the
+        material's trees plus their own, so the other regions are unaffected.
+        """
+        serving = self.serving  # One consistent version for the whole horizon
+        model = serving.models[material]
+        n_regions, days_ahead = len(regions), len(day_of_week)
+        region_models = serving.series_models.get(material, {})
+        series_forests = {i: region_models[region] for i, region in enumerate(regions) if region in region_models}
+        
+        trees = None
+        series_trees = {}
+        if quantiles:
+            if not isinstance(model, (FlatForest, RandomForestRegressor)):
+                raise ValueError(f"Prediction intervals need per-tree outputs, not available for the {self.engine} engine")
+            trees = np.empty((len(model), n_regions, days_ahead))
+            series_trees = {i: np.empty((len(forest), days_ahead)) for i, forest in series_forests.items()}
+        
+        def score(block, block_features):
+            if trees is None:
+                predicted = self._predict_rows(model, block_features).reshape(n_regions, -1)
+            else:
+                block_trees = self._tree_predictions(model, block_features).reshape(len(trees), n_regions, -1)
+                trees[:, :, block] = block_trees
+                predicted = block_trees.sum(axis=0) / len(block_trees)
+            for i, forest in series_forests.items():
+                region_trees = self._tree_predictions(forest, block_features.reshape(n_regions, -1, 5)[i])
+                if trees is not None:
+                    series_trees[i][:, block] = region_trees
+                predicted[i] = (predicted[i] * len(model) + region_trees.sum(axis=0)) / (len(model) + len(region_trees))
+            return predicted
+        
+        # Start each series from its latest real rolling averages
+        region_codes, prev_7day_avg, prev_30day_avg = self._series_seed(material, regions, serving)
+        
+        features = np.empty((n_regions, days_ahead, 5))
+        features[:, :, 0] = day_of_week
+        features[:, :, 1] = month
+        features[:, :, 2] = prev_7day_avg[:, None]
+        features[:, :, 3] = prev_30day_avg[:, None]
+        features[:, :, 4] = region_codes[:, None]
+        
+        if mode == 'fixed':
+            predicted = score(slice(None), features.reshape(-1, 5))
+        else:
+            step = 1 if mode == 'recursive' else max(1, block_size)
+            predicted = np.empty((n_regions, days_ahead))
+            for block_start in range(0, days_ahead, step):
+                block = slice(block_start, block_start + step)
+                features[:, block, 2] = prev_7day_avg[:, None]
+                block_features = features[:, block].reshape(-1, 5)
+                predicted[:, block] = score(block, block_features)
+                
+                # Update rolling averages (simplified)
+                prev_7day_avg = predicted[:, block][:, -7:].mean(axis=1)
+        
+        if trees is None:
+            return predicted
+        bands = np.percentile(trees, quantiles, axis=0)
+        for i, region_trees in series_trees.items():
+            bands[:, i] = np.percentile(np.concatenate([trees[:, i], region_trees]), quantiles, axis=0)
+        return predicted, bands
+    
+    def _prediction_records(self, date_strings, predicted, bands=None, quantiles=()):
+        """
+        [{'date', 'predicted_volume', 'p10', ...}] for one series, values
+        rounded to 2 decimals. bands is (quantiles, days) or None.
+        """
+        records = [
+            {'date': date, 'predicted_volume': volume}
+            for date, volume in zip(date_strings, np.round(predicted, 2).tolist())
+        ]
+        if bands is not None:
+            for q, band in zip(quantiles, np.round(bands, 2).tolist()):
+                for record, value in zip(records, band):
+                    record[f'p{q}'] = value
+        return records
+    
+    def predict_future_supply(self, material_type, region, days_ahead=30, mode='block', block_size=7, quantiles=None):
         """
         Predict future supply for a specific material and region.
+        
+        The horizon feature matrix is built once and scored in bulk:
+        - 'fixed': rolling features held constant, one predict call
+        - 'block': score block_size days at a time, then roll prev_7day_avg
+          forward to the mean of the block just predicted
+        - 'recursive': one day at a time, feeding each prediction back as
+          prev_7day_avg (the original per-day behaviour)
+        With quantiles (e.g. QUANTILES) each day also gets p{q} fields from
+        the spread of the forest's trees.
         """
         if material_type not in self.models:
             raise ValueError(f"No model trained for {material_type}")
-        
-        model = self.models[material_type]
+        if mode not in PREDICTION_MODES:
+            raise ValueError(f"Unknown prediction mode: {mode}")
         
         # Generate future dates
-        predictions = []
-        current_date = datetime.now()
+        date_strings, day_of_week, month = self._horizon_calendar(days_ahead)
         
-        # Use recent averages as baseline
-        prev_7day_avg = 50  # Placeholder, would use real data
-        prev_30day_avg = 48
+        if quantiles:
+            predicted, bands = self._predict_horizon(
+                material_type, [region], day_of_week, month, mode, block_size, quantiles
+            )
+            return self._prediction_records(date_strings, predicted[0], bands[:, 0], quantiles)
         
-        region_code = self.regions.index(region) if region in self.regions else 0
+        predicted = self._predict_horizon(
+            material_type, [region], day_of_week, month, mode, block_size
+        )[0]
+        return self._prediction_records(date_strings, predicted)
+    
+    def _market_query(self, days_ahead, materials=None, regions=None, fields=None, daily_days=DAILY_PREDICTION_DAYS):
+        """
+        Validate a market forecast selection. materials and regions default
+        to all, fields to MARKET_FIELDS. Returns a dict with the horizon
+        that actually has to be scored: totals need every day, daily values
+        only the first daily_days (later days never feed back into them).
+        """
+        materials = [m for m in self.material_types if m in self.models] if materials is None else list(materials)
+        regions = list(self.regions) if regions is None else list(regions)
+        fields = tuple(MARKET_FIELDS if fields is None else fields)
+        for name, values, known in (('materials', materials, self.models),
+                                    ('regions', regions, self.regions),
+                                    ('fields', fields, MARKET_FIELDS)):
+            unknown = [value for value in values if value not in known]
+            if unknown:
+                raise ValueError(f"Unknown {name}: {', '.join(unknown)}")
         
-        for day in range(days_ahead):
-            future_date = current_date + timedelta(days=day)
-            day_of_week = future_date.weekday()
-            month = future_date.month
-            
-            # Prepare features
-            features = np.array([[day_of_week, month, prev_7day_avg, prev_30day_avg, region_code]])
-            
-            # Predict
-            predicted_volume = model.predict(features)[0]
-            
-            predictions.append({
-                'date': future_date.strftime('%Y-%m-%d'),
-                'predicted_volume': round(predicted_volume, 2)
-            })
-            
-            # Update rolling averages (simplified)
-            prev_7day_avg = predicted_volume
+        daily_days = max(0, min(int(daily_days), days_ahead))
+        horizon = days_ahead if 'total_volume_tons' in fields else daily_days
+        return {'materials': materials, 'regions': regions, 'fields': fields,
+                'daily_days': daily_days, 'horizon': horizon}
+    
+    def _region_forecasts(self, material, regions, calendar, query, mode='block', block_size=7, quantiles=None):
+        """
+        Score one material for the given regions in a single matrix pass and
+        yield (region, {field: value}) for each with the query's fields.
+        """
+        date_strings, day_of_week, month = calendar
+        bands = None
+        if quantiles:
+            predicted, bands = self._predict_horizon(
+                material, regions, day_of_week, month, mode, block_size, quantiles
+            )
+        else:
+            predicted = self._predict_horizon(
+                material, regions, day_of_week, month, mode, block_size
+            )
+        totals = np.round(predicted, 2).sum(axis=1)
+        
+        daily_days = query['daily_days']
+        for i, (region, total_volume) in enumerate(zip(regions, totals)):
+            forecast = {}
+            if 'total_volume_tons' in query['fields']:
+                forecast['total_volume_tons'] = round(float(total_volume), 2)
+            if 'daily_predictions' in query['fields']:
+                forecast['daily_predictions'] = self._prediction_records(
+                    date_strings[:daily_days],
+                    predicted[i, :daily_days],
+                    None if bands is None else bands[:, i, :daily_days],
+                    quantiles
+                )
+            yield region, forecast
+    
+    def _material_market_forecast(self, material, query, mode='block', block_size=7, quantiles=None):
+        """
+        Forecast one material for the query's regions in a single matrix pass.
+        """
+        return dict(self._region_forecasts(
+            material, query['regions'], self._horizon_calendar(query['horizon']), query, mode, block_size, quantiles
+        ))
+    
+    def _check_quantiles(self, quantiles):
+        if quantiles and self.engine != 'random_forest':
+            raise ValueError(f"Prediction intervals need per-tree outputs, not available for the {self.engine} engine")
+    
+    def iter_market_forecast(self, days_ahead=90, quantiles=None, chunk_regions=MARKET_STREAM_REGIONS,
+                             materials=None, regions=None, fields=None, daily_days=DAILY_PREDICTION_DAYS):
+        """
+        Market forecast as a stream of {'material', 'region', field: value}
+        records, scoring chunk_regions regions at a time so memory does not
+        grow with the number of regions. Takes the same selection arguments
+        as get_market_forecast; they are validated before the first record.
+        """
+        self._check_quantiles(quantiles)
+        query = self._market_query(days_ahead, materials, regions, fields, daily_days)
+        calendar = self._horizon_calendar(query['horizon'])
         
-        return predictions
+        def records():
+            for material in query['materials']:
+                for start in range(0, len(query['regions']), chunk_regions):
+                    chunk = query['regions'][start:start + chunk_regions]
+                    for region, forecast in self._region_forecasts(material, chunk, calendar, query, quantiles=quantiles):
+                        yield {'material': material, 'region': region, **forecast}
+        return records()
     
-    def get_market_forecast(self, days_ahead=90):
+    def get_market_forecast(self, days_ahead=90, workers=None, quantiles=None,
+                            materials=None, regions=None, fields=None, daily_days=DAILY_PREDICTION_DAYS):
         """
-        Get complete market forecast for all materials and regions.
+        Get the market forecast for all (or the selected) materials and regions.
+        Each material is scored as one regions x days matrix; pass workers
+        to fan materials out across a process pool, and quantiles to add
+        p{q} bands to the daily predictions. fields picks the per-region
+        values (see MARKET_FIELDS) and daily_days the length of
+        daily_predictions; only the selected cells are computed.
         """
-        forecast = {}
+        self._check_quantiles(quantiles)
+        query = self._market_query(days_ahead, materials, regions, fields, daily_days)
+        forecast = {material: {} for material in (self.material_types if materials is None else query['materials'])}
+        materials = query['materials']
+        
+        if workers and workers > 1 and len(materials) > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_market_worker, initargs=(self,)) as pool:
+                results = pool.map(_market_forecast_worker, [(m, query, quantiles) for m in materials])
+                # Failed materials come back as None and keep an empty entry, like the serial path
+                forecast.update((m, result) for m, result in zip(materials, results) if result is not None)
+            return forecast
         
-        for material in self.material_types:
-            forecast[material] = {}
-            for region in self.regions:
-                try:
-                    predictions = self.predict_future_supply(material, region, days_ahead)
-                    total_volume = sum(p['predicted_volume'] for p in predictions)
-                    forecast[material][region] = {
-                        'total_volume_tons': round(total_volume, 2),
-                        'daily_predictions': predictions[:30]  # First 30 days
-                    }
-                except Exception as e:
-                    print(f"[ML] Error predicting {material} in {region}: {e}")
+        for material in materials:
+            try:
+                forecast[material] = self._material_market_forecast(material, query, quantiles=quantiles)
+            except Exception as e:
+                print(f"[ML] Error predicting {material}: {e}")
         
         return forecast
     
-    def save_models(self, path='backend/models'):
+    def _model_inputs(self, material, featured_rows):
+        """
+        (X, y) for one material's prepared rows, with regions encoded as
+        the material's model was trained (see build_series_state).
+        """
+        region_codes = {region: state['code'] for region, state in self.series_state.get(material, {}).items()}
+        X = featured_rows[['day_of_week', 'month', 'prev_7day_avg', 'prev_30day_avg']].copy()
+        X['region'] = featured_rows['region'].map(region_codes)
+        return X, featured_rows['volume_tons']
+    
+    def _warm_start_series(self, window_rows, featured, new_trees):
+        """
+        Per-series forests after a warm-start ingest. Every series with new
+        rows gets new_trees trees fitted on its prepared window (stored tail
+        plus new rows), appended to the trees it already had; the oldest
+        are dropped once base plus added trees exceed MAX_TREES. Returns a
+        new series_models dict, other series keep their trees untouched.
+        """
+        series_models = {material: dict(regions) for material, regions in self.series_models.items()}
+        params = ENGINE_PARAMS[self.engine]
+        updated = set(zip(featured['material_type'], featured['region']))
+        for (material, region), rows in window_rows.groupby(['material_type', 'region'], sort=False):
+            if (material, region) not in updated or material not in self.models:
+                continue
+            if region not in self.series_state.get(material, {}):
+                continue
+            previous = series_models.get(material, {}).get(region)
+            added = len(previous) if previous is not None else 0
+            model = RandomForestRegressor(
+                n_estimators=new_trees, max_depth=params.get('max_depth'),
+                random_state=self.random_state + added
+            )
+            model.fit(*self._model_inputs(material, rows))
+            forest = FlatForest.from_forest(model)
+            if previous is not None:
+                forest = FlatForest.concat([previous, forest])
+            keep = MAX_TREES - len(self.models[material])
+            if keep > 0:
+                series_models.setdefault(material, {})[region] = forest.last_trees(keep)
+        return series_models
+    
+    def resolve_update(self, update):
+        """
+        The model refresh ingest_observations runs for update: engines
+        without per-tree updates refit on the window instead of warm-starting.
+        """
+        if update not in ('warm_start', 'window', None):
+            raise ValueError(f"Unknown update mode: {update}")
+        if update == 'warm_start' and self.engine != 'random_forest':
+            print(f"[ML] {self.engine} models cannot be warm-started, refitting on the window instead")
+            return 'window'
+        return update
+    
+    def observation_rows(self, observations):
+        """
+        Validated observations as DATA_COLUMNS rows, one per (region,
+        material, date). Raises ValueError for missing or malformed fields.
+        """
+        new_rows = pd.DataFrame(observations)
+        missing = {'date', 'region', 'material_type', 'volume_tons'} - set(new_rows.columns)
+        if missing:
+            raise ValueError(f"Observations missing fields: {sorted(missing)}")
+        
+        dates = pd.to_datetime(new_rows['date'])
+        return new_rows.assign(
+            date=dates.dt.strftime('%Y-%m-%d'),
+            day_of_week=dates.dt.dayofweek.astype(np.int64),
+            month=dates.dt.month.astype(np.int64),
+            volume_tons=new_rows['volume_tons'].astype(float)
+        )[DATA_COLUMNS].drop_duplicates(['region', 'material_type', 'date'], keep='last')
+    
+    def ingest_observations(self, observations, update='warm_start', new_trees=10, window_days=365, path=MODELS_DIR):
         """
-        Save trained models to disk.
+        Append new daily observations (date, region, material_type,
+        volume_tons) to the feature store and refresh the models.
+        
+        Rolling features are computed from the stored tails of the affected
+        series only. update selects the model refresh:
+        - 'warm_start': for each affected series, add new_trees trees fitted
+          on its stored tail plus the new rows. They only vote for that
+          series (see series_models), and base plus added trees are capped
+          at MAX_TREES, dropping the oldest added trees
+        - 'window': refit on the window_days before the end of the stored
+          history plus the new rows
+        - None: only store the observations
+        The models are refreshed before anything is stored, so a failed
+        update leaves the feature store unchanged, and the new models are
+        swapped in whole. Ingests run one at a time under a module-level
+        lock. Returns a summary dict.
         """
-        os.makedirs(path, exist_ok=True)
-        for material, model in self.models.items():
-            filename = f"{path}/{material}_model.pkl"
-            with open(filename, 'wb') as f:
+        with _ingest_lock:
+            return self._ingest_observations(observations, update, new_trees, window_days, path)
+    
+    def _ingest_observations(self, observations, update, new_trees, window_days, path):
+        """
+        ingest_observations body, run while holding _ingest_lock.
+        """
+        update = self.resolve_update(update)
+        new_rows = self.observation_rows(observations)
+        
+        base_key = self.artifact_key()
+        store = FeatureStore(os.path.join(FEATURE_STORE_DIR, base_key))
+        if not store.exists():
+            print("[ML] Initializing feature store from the real data history...")
+            store.initialize(self.prepare_features(self.load_real_data()))
+        
+        # Only observations newer than each series' stored history are accepted
+        series_keys = list(new_rows.groupby(['region', 'material_type']).groups)
+        history = store.tail_rows(series_keys)
+        if not history.empty:
+            last_dates = history.groupby(['region', 'material_type'])['date'].max().rename('last_date')
+            new_rows = new_rows.join(last_dates, on=['region', 'material_type'])
+            stale = new_rows['last_date'].notna() & (new_rows['date'] <= new_rows['last_date'])
+            if stale.any():
+                print(f"[ML] Skipping {int(stale.sum())} observations not newer than stored history")
+            new_rows = new_rows[~stale].drop(columns='last_date')
+        if new_rows.empty:
+            return {'ingested': 0, 'series': 0, 'update': None, 'model_version': self.model_version}
+        
+        # Rolling features from tail + new rows, keeping only the new rows
+        combined = pd.concat([history.assign(_new=False), new_rows.assign(_new=True)], ignore_index=True)
+        window_rows = self.prepare_features(combined)
+        is_new = window_rows['_new'].astype(bool)
+        featured = window_rows[is_new].drop(columns='_new')
+        
+        if update == 'window':
+            # Anchor the window to the stored history, so it never holds just the new rows
+            history_end = max(segment['max_date'] for segment in store.state['segments'])
+            since = (pd.Timestamp(history_end) - pd.Timedelta(days=window_days)).strftime('%Y-%m-%d')
+            window = pd.concat([store.load_window(since)[DATA_COLUMNS], featured[DATA_COLUMNS]], ignore_index=True)
+            counts = window['material_type'].value_counts()
+            short = [m for m in self.material_types if counts.get(m, 0) < MIN_REFIT_ROWS]
+            if short:
+                raise ValueError(f"Window refit needs {MIN_REFIT_ROWS} rows per material, too few for: {', '.join(short)}")
+            self.train_models(window)
+        elif update == 'warm_start':
+            series_models = self._warm_start_series(window_rows.drop(columns='_new'), featured, new_trees)
+            
+            # Move the affected series' state index entries forward, on a copy
+            series_state = {material: dict(states) for material, states in self.series_state.items()}
+            for material, material_state in self.build_series_state(featured).items():
+                for region, state in material_state.items():
+                    if region in series_state.get(material, {}):
+                        state['code'] = series_state[material][region]['code']
+                        series_state[material][region] = state
+            self.serving = self.serving._replace(series_state=series_state, series_models=series_models)
+            self.model_generation += 1
+        
+        store.append(featured)
+        print(f"[ML] Ingested {len(featured)} observations for {len(series_keys)} series")
+        
+        if update:
+            store.state['updates'] += 1
+            version = f"{base_key}+{store.state['updates']}"
+            if update == 'warm_start' and self.base_version is not None:
+                # Only the series state and series forests changed
+                self.save_models(path, version, series_only=True)
+            else:
+                self.save_models(path, version)
+                self.load_models(path, version)
+            store.state['model_version'] = version
+            store.save_state()
+            self._prune_updates(path, base_key)
+        
+        return {
+            'ingested': len(featured),
+            'series': len(series_keys),
+            'update': update,
+            'model_version': self.model_version
+        }
+    
+    def artifact_key(self, csv_path=DATA_CSV_PATH):
+        """
+        Hash of everything the trained models depend on: the source CSV,
+        the feature code version, the engine and its hyperparameters.
+        """
+        digest = hashlib.sha256()
+        if os.path.exists(csv_path):
+            with open(csv_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+        digest.update(json.dumps({
+            'feature_version': FEATURE_VERSION,
+            'engine': self.engine,
+            'model_params': ENGINE_PARAMS[self.engine],
+            'random_state': self.random_state,
+            'material_types': self.material_types
+        }, sort_keys=True).encode())
+        return digest.hexdigest()[:16]
+    
+    def save_models(self, path=MODELS_DIR, key=None, series_only=False):
+        """
+        Save trained models to disk under a versioned directory path/<key>.
+        
+        With series_only (warm-start updates, which change nothing else)
+        only the series state index and series forests are written; the
+        manifest points at the unchanged model files of self.base_version.
+        """
+        key = key or self.model_version or self.artifact_key()
+        if series_only and self.base_version is None:
+            raise ValueError("Cannot save a series update before the models themselves are saved")
+        base = self.base_version if series_only else key
+        version_dir = os.path.join(path, key)
+        tmp_dir = f"{version_dir}.tmp{os.getpid()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        for material, model in ({} if series_only else self.models).items():
+            if isinstance(model, RandomForestRegressor):
+                model = FlatForest.from_forest(model)
+            # Forests are stored as flat tree arrays that servers memory-map
+            if isinstance(model, FlatForest):
+                model.save(f"{tmp_dir}/{material}_forest")
+                continue
+            with open(f"{tmp_dir}/{material}_model.pkl", 'wb') as f:
                 pickle.dump(model, f)
-        print(f"[ML] Models saved to {path}")
+        with open(f"{tmp_dir}/series_state.json", 'w') as f:
+            json.dump(self.series_state, f)
+        if self.series_models:
+            with open(f"{tmp_dir}/series_models.pkl", 'wb') as f:
+                pickle.dump(self.series_models, f)
+        with open(f"{tmp_dir}/manifest.json", 'w') as f:
+            json.dump({
+                'key': key,
+                'feature_version': FEATURE_VERSION,
+                'engine': self.engine,
+                'model_params': ENGINE_PARAMS[self.engine],
+                'materials': list(self.models),
+                'regions': self.regions,
+                'base': base,
+                'created_at': datetime.now().isoformat()
+            }, f, indent=2)
+        
+        # Swap the finished directory in so readers never see a partial version
+        if os.path.exists(version_dir):
+            shutil.rmtree(version_dir)
+        os.replace(tmp_dir, version_dir)
+        self.model_version = key
+        self.base_version = base
+        print(f"[ML] {'Series update' if series_only else 'Models'} saved to {version_dir}")
+    
+    def _prune_updates(self, path, base_key):
+        """
+        Delete superseded <base_key>+N update versions, keeping the loaded
+        version and the one holding its model files.
+        """
+        keep = {self.model_version, self.base_version}
+        for name in os.listdir(path):
+            if name.startswith(f"{base_key}+") and name not in keep and '.tmp' not in name:
+                shutil.rmtree(os.path.join(path, name), ignore_errors=True)
     
-    def load_models(self, path='backend/models'):
+    def load_models(self, path=MODELS_DIR, key=None, mmap=None):
         """
-        Load trained models from disk.
+        Load trained models for the given artifact key from disk.
+        Forests come back as FlatForests: with mmap (default
+        ML_MMAP_MODELS, on) their tree arrays are memory-mapped read-only,
+        otherwise read into memory. Other engines are unpickled.
+        Returns True only if every material's model was found.
         """
-        for material in self.material_types:
-            filename = f"{path}/{material}_model.pkl"
-            if os.path.exists(filename):
+        mmap = MMAP_MODELS if mmap is None else mmap
+        key = key or self.artifact_key()
+        version_dir = os.path.join(path, key)
+        manifest_path = f"{version_dir}/manifest.json"
+        if not os.path.exists(manifest_path):
+            return False
+        
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            # Series updates keep their model files in the base version
+            base = manifest.get('base', key)
+            base_dir = os.path.join(path, base)
+            models = {}
+            for material in self.material_types:
+                forest_prefix = f"{base_dir}/{material}_forest"
+                if os.path.exists(f"{forest_prefix}.json"):
+                    models[material] = FlatForest.load(forest_prefix, mmap=mmap)
+                    continue
+                filename = f"{base_dir}/{material}_model.pkl"
+                if not os.path.exists(filename):
+                    return False
                 with open(filename, 'rb') as f:
-                    self.models[material] = pickle.load(f)
-        print(f"[ML] Models loaded from {path}")
+                    models[material] = pickle.load(f)
+                if isinstance(models[material], RandomForestRegressor):
+                    models[material] = FlatForest.from_forest(models[material])
+            series_models = {}
+            if os.path.exists(f"{version_dir}/series_models.pkl"):
+                with open(f"{version_dir}/series_models.pkl", 'rb') as f:
+                    series_models = pickle.load(f)
+        except Exception as e:
+            print(f"[ML] Error loading models from {version_dir}: {e}")
+            return False
+        
+        series_state = {}
+        if os.path.exists(f"{version_dir}/series_state.json"):
+            with open(f"{version_dir}/series_state.json") as f:
+                series_state = json.load(f)
+        
+        self.regions = manifest['regions']
+        self.serving = ServingModels(models, series_state, self.build_fallback_codes(), series_models)
+        self.model_version = key
+        self.base_version = base
+        self.model_generation += 1
+        print(f"[ML] Models loaded from {version_dir}")
+        return True
+    
+    def load_or_train(self, path=MODELS_DIR):
+        """
+        Load cached models if the artifact key matches, otherwise retrain on
+        the real data and store a new version. Returns the training frame
+        when a retrain happened, else None.
+        """
+        key = self.artifact_key()
+        
+        # Incrementally updated models for this key take precedence
+        store = FeatureStore(os.path.join(FEATURE_STORE_DIR, key))
+        latest = store.state['model_version']
+        if latest and self.load_models(path, latest):
+            return None
+        if self.load_models(path, key):
+            return None
+        
+        print(f"[ML] No cached models for key {key}, training new models with Real Data...")
+        df = self.load_real_data()
+        self.train_models(df)
+        self.save_models(path, key)
+        return df
 
 
-# Initialize and train on import
-print("[ML] Initializing Waste Supply Forecaster...")
-forecaster = WasteSupplyForecaster()
+class ForecastCache:
+    """
+    Bounded in-process LRU cache in front of a WasteSupplyForecaster.
+    Forecasts only depend on (material, region, days, calendar date, model
+    version), so entries expire at the day boundary and the whole cache is
+    dropped whenever the forecaster's models change.
+    """
+    
+    def __init__(self, forecaster, max_entries=256):
+        self.forecaster = forecaster
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_state = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def _get_or_compute(self, key, compute):
+        model_state = (self.forecaster.model_version, self.forecaster.model_generation)
+        today = datetime.now().date().isoformat()
+        
+        with self._lock:
+            if model_state != self._model_state:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._model_state = model_state
+            
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == today:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        
+        # Compute outside the lock so one slow forecast doesn't block hits
+        value = compute()
+        
+        with self._lock:
+            if model_state == self._model_state:
+                self._entries[key] = (today, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+    
+    def predict_future_supply(self, material_type, region, days_ahead=30, quantiles=None):
+        quantiles = tuple(quantiles or ())
+        return self._get_or_compute(
+            ('supply', material_type, region, days_ahead, quantiles),
+            lambda: self.forecaster.predict_future_supply(material_type, region, days_ahead, quantiles=quantiles)
+        )
+    
+    def get_market_forecast(self, days_ahead=90, quantiles=None, materials=None, regions=None,
+                            fields=None, daily_days=DAILY_PREDICTION_DAYS):
+        quantiles = tuple(quantiles or ())
+        selection = tuple(None if values is None else tuple(values) for values in (materials, regions, fields))
+        return self._get_or_compute(
+            ('market', days_ahead, quantiles, selection, daily_days),
+            lambda: self.forecaster.get_market_forecast(
+                days_ahead, quantiles=quantiles, materials=materials, regions=regions,
+                fields=fields, daily_days=daily_days
+            )
+        )
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'model_version': self.forecaster.model_version
+            }
+
+
+# Process pool workers for get_market_forecast(workers=N)
+_worker_forecaster = None
+
+def _init_market_worker(forecaster):
+    global _worker_forecaster
+    _worker_forecaster = forecaster
+
+def _market_forecast_worker(args):
+    material, query, quantiles = args
+    try:
+        return _worker_forecaster._material_market_forecast(material, query, quantiles=quantiles)
+    except Exception as e:
+        print(f"[ML] Error predicting {material}: {e}")
+        return None
+
+
+# Background warm-up: loading or training the models can take a while, so
+# servers call start_warm_up() once at startup and check is_ready() before
+# use. Importing this module never starts it (benchmarks, tests and pool
+# workers would otherwise compete with a training thread).
+warm_up_state = {'status': 'warming_up', 'error': None, 'started_at': None, 'ready_at': None}
+_warm_up_lock = threading.Lock()
+_warm_up_thread = None
 
-# Generate and train if models don't exist
-if not os.path.exists('backend/models') or True: # Force retrain for now to pick up new CSV data
-    print("[ML] Training new models with Real Data...")
-    df = forecaster.load_real_data()
-    forecaster.train_models(df)
-    forecaster.save_models()
-    
-    # Save sample data for reference
-    df.to_json('backend/data/training_waste_data.json', orient='records', indent=2)
-    print("[ML] Training data saved to backend/data/training_waste_data.json")
-else:
-    print("[ML] Loading existing models...")
-    forecaster.load_models()
-
-print("[ML] Forecaster ready!")
+def _warm_up():
+    warm_up_state['started_at'] = datetime.now().isoformat()
+    try:
+        training_df = forecaster.load_or_train()
+        
+        warm_up_state['ready_at'] = datetime.now().isoformat()
+        warm_up_state['status'] = 'ready'
+        print("[ML] Forecaster ready!")
+    except Exception as e:
+        warm_up_state['error'] = str(e)
+        warm_up_state['status'] = 'failed'
+        print(f"[ML] Forecaster warm-up failed: {e}")
+        return
+    
+    if training_df is not None:
+        # Save training data for reference, after the forecaster is already serving
+        try:
+            export_training_data(training_df)
+        except Exception as e:
+            print(f"[ML] Error saving training data: {e}")
+
+def start_warm_up():
+    """
+    Start loading/training the models in a background thread (once).
+    """
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=_warm_up, name='ml-warm-up', daemon=True)
+            _warm_up_thread.start()
+    return _warm_up_thread
+
+def is_ready():
+    return warm_up_state['status'] == 'ready'
+
+
+# Background window refits: ingest_observations(update='window') retrains
+# every model, so servers run it off the request thread and report progress here
+refit_state = {'status': 'idle', 'error': None, 'result': None, 'started_at': None, 'finished_at': None}
+_refit_lock = threading.Lock()
+_refit_thread = None
+
+def _window_refit(rows, window_days):
+    try:
+        refit_state['result'] = forecaster.ingest_observations(rows, update='window', window_days=window_days)
+        refit_state['status'] = 'done'
+    except Exception as e:
+        refit_state['error'] = str(e)
+        refit_state['status'] = 'failed'
+        print(f"[ML] Window refit failed: {e}")
+    refit_state['finished_at'] = datetime.now().isoformat()
+
+def start_window_refit(observations, window_days=365):
+    """
+    Ingest observations into the shared forecaster with a window refit in
+    a background thread. The observations are validated first (ValueError).
+    Returns False without starting anything if a refit is already running.
+    """
+    global _refit_thread
+    rows = forecaster.observation_rows(observations)
+    with _refit_lock:
+        if _refit_thread is not None and _refit_thread.is_alive():
+            return False
+        refit_state.update(status='running', error=None, result=None,
+                           started_at=datetime.now().isoformat(), finished_at=None)
+        _refit_thread = threading.Thread(target=_window_refit, args=(rows, window_days),
+                                         name='ml-window-refit', daemon=True)
+        _refit_thread.start()
+    return True
+
+def wait_until_ready(timeout=None):
+    """
+    Block until warm-up finishes (starting it if needed). Returns is_ready().
+    """
+    start_warm_up().join(timeout)
+    return is_ready()
+
+
+# Shared forecaster; models are loaded by start_warm_up() / wait_until_ready()
+forecaster = WasteSupplyForecaster()
+forecast_cache = ForecastCache(forecaster)
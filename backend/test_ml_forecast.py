@@ -0,0 +1,164 @@
+"""
+Regression tests for incremental updates (ingest_observations).
+Run from backend/: python -m unittest test_ml_forecast
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import ml_forecast
+from ml_forecast import DEFAULT_ROLLING_STATE, FeatureStore, WasteSupplyForecaster
+
+# Small forests keep the tests fast; the artifact key follows these params
+SMALL_FOREST = {'n_estimators': 10, 'max_depth': 8}
+
+
+class IngestObservationsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.patches = [mock.patch.dict(ml_forecast.ENGINE_PARAMS['random_forest'], SMALL_FOREST)]
+        for patch in cls.patches:
+            patch.start()
+        cls.base_dir = tempfile.mkdtemp()
+        forecaster = WasteSupplyForecaster('random_forest')
+        history = forecaster.load_real_data()
+        forecaster.train_models(history[history['date'] >= '2023-07-01'], n_jobs=1)
+        cls.base_key = forecaster.artifact_key()
+        forecaster.save_models(cls.base_dir, cls.base_key)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.base_dir, ignore_errors=True)
+        for patch in cls.patches:
+            patch.stop()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.models_dir = os.path.join(self.tmp_dir, 'models')
+        shutil.copytree(self.base_dir, self.models_dir)
+        store_patch = mock.patch.object(ml_forecast, 'FEATURE_STORE_DIR', os.path.join(self.tmp_dir, 'store'))
+        store_patch.start()
+        self.addCleanup(store_patch.stop)
+        self.addCleanup(shutil.rmtree, self.tmp_dir, True)
+
+        self.forecaster = WasteSupplyForecaster('random_forest')
+        self.assertTrue(self.forecaster.load_models(self.models_dir, self.base_key))
+
+    def store(self):
+        return FeatureStore(os.path.join(ml_forecast.FEATURE_STORE_DIR, self.base_key))
+
+    def forecast(self, region, material='PET'):
+        return sum(day['predicted_volume']
+                   for day in self.forecaster.predict_future_supply(material, region, days_ahead=30))
+
+    def test_warm_start_only_moves_the_updated_series(self):
+        updated, other = self.forecaster.regions[0], self.forecaster.regions[5]
+        before = {region: self.forecast(region) for region in (updated, other)}
+
+        result = self.forecaster.ingest_observations(
+            [{'date': '2024-01-01', 'region': updated, 'material_type': 'PET', 'volume_tons': 10.0}],
+            update='warm_start', path=self.models_dir
+        )
+
+        self.assertEqual(result['ingested'], 1)
+        self.assertEqual(self.forecast(other), before[other])
+        self.assertNotEqual(self.forecast(updated), before[updated])
+        self.assertEqual(self.forecaster.series_state['PET'][updated]['date'], '2024-01-01')
+
+        # The added trees survive a reload of the new version
+        reloaded = WasteSupplyForecaster('random_forest')
+        self.assertTrue(reloaded.load_models(self.models_dir, result['model_version']))
+        self.assertIn(updated, reloaded.series_models['PET'])
+
+    def test_warm_start_saves_only_a_series_update(self):
+        region = self.forecaster.regions[0]
+        for day in ('2024-01-01', '2024-01-02'):
+            result = self.forecaster.ingest_observations(
+                [{'date': day, 'region': region, 'material_type': 'PET', 'volume_tons': 10.0}],
+                update='warm_start', path=self.models_dir
+            )
+
+        # The superseded +1 update is pruned, the base version is untouched
+        self.assertEqual(sorted(os.listdir(self.models_dir)), sorted([self.base_key, result['model_version']]))
+        update_dir = os.path.join(self.models_dir, result['model_version'])
+        self.assertEqual(sorted(os.listdir(update_dir)), ['manifest.json', 'series_models.pkl', 'series_state.json'])
+        self.assertEqual(self.forecaster.base_version, self.base_key)
+
+    def test_window_refit_is_anchored_to_stored_history(self):
+        region = self.forecaster.regions[0]
+        result = self.forecaster.ingest_observations(
+            [{'date': '2026-03-01', 'region': region, 'material_type': 'PET', 'volume_tons': 40.0},
+             {'date': '2026-03-02', 'region': region, 'material_type': 'PET', 'volume_tons': 42.0}],
+            update='window', window_days=30, path=self.models_dir
+        )
+
+        self.assertEqual(result['ingested'], 2)
+        self.assertEqual(self.store().state['updates'], 1)
+        other_state = self.forecaster.series_state['PET'][self.forecaster.regions[5]]
+        self.assertNotEqual((other_state['prev_7day_avg'], other_state['prev_30day_avg']), DEFAULT_ROLLING_STATE)
+
+    def test_concurrent_ingests_are_all_stored(self):
+        regions = self.forecaster.regions[:4]
+        errors = []
+
+        def ingest(region):
+            try:
+                self.forecaster.ingest_observations(
+                    [{'date': '2024-01-01', 'region': region, 'material_type': 'PET', 'volume_tons': 10.0}],
+                    update='warm_start', path=self.models_dir
+                )
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=ingest, args=(region,)) for region in regions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        store = self.store()
+        self.assertEqual(len(store.state['segments']), 1 + len(regions))
+        self.assertEqual(store.state['updates'], len(regions))
+        for region in regions:
+            self.assertEqual(store.tails[(region, 'PET')]['date'].max(), '2024-01-01')
+            self.assertIn(region, self.forecaster.series_models['PET'])
+
+    def test_failed_refit_stores_nothing(self):
+        region = self.forecaster.regions[0]
+        with mock.patch.object(ml_forecast, 'MIN_REFIT_ROWS', 10 ** 9):
+            with self.assertRaises(ValueError):
+                self.forecaster.ingest_observations(
+                    [{'date': '2026-03-01', 'region': region, 'material_type': 'PET', 'volume_tons': 40.0}],
+                    update='window', path=self.models_dir
+                )
+
+        store = self.store()
+        self.assertEqual(len(store.state['segments']), 1)
+        self.assertEqual(store.state['updates'], 0)
+        self.assertEqual(store.tails[(region, 'PET')]['date'].max(), '2023-12-31')
+        self.assertEqual(self.forecaster.model_version, self.base_key)
+
+
+class RegionEncodingTest(unittest.TestCase):
+
+    def test_categorical_regions_predict_with_their_training_codes(self):
+        # Synthetic regions are categoricals in self.regions order, not sorted
+        forecaster = WasteSupplyForecaster('seasonal_linear')
+        forecaster.train_models(forecaster.generate_synthetic_data(120), n_jobs=1)
+        # Forecasts divided by each region's multiplier should all agree
+        scaled = {}
+        for region, multiplier in ml_forecast.SYNTHETIC_REGION_MULTIPLIERS.items():
+            predicted = forecaster.predict_future_supply('PET', region, days_ahead=7, mode='fixed')
+            scaled[region] = sum(day['predicted_volume'] for day in predicted) / len(predicted) / multiplier
+        average = sum(scaled.values()) / len(scaled)
+        for region, value in scaled.items():
+            self.assertAlmostEqual(value / average, 1.0, delta=0.15, msg=region)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,18 @@
 import google.generativeai as genai
+import numpy as np
 import pandas as pd
 import random
 import os
+import hashlib
+import threading
+from collections import namedtuple
+from datetime import date
+from types import MappingProxyType
 from dotenv import load_dotenv
 from PIL import Image
 
+import india_data
+
 # Load environment variables
 load_dotenv()
 
@@ -186,11 +194,22 @@ def get_disposal_guidance(waste_type):
         
         return f"⚠️ Could not fetch AI guidance. Generic tips for {waste_type}: Clean it, check if recyclable, and dispose accordingly."
 
-def get_dashboard_data():
+def simulation_rng(name, day=None):
+    """
+    random.Random seeded from (lowercased name, day), so simulated values
+    are identical for the same city on the same day (default today).
+    """
+    day = day or date.today()
+    digest = hashlib.sha256(f"{name.strip().lower()}|{day.isoformat()}".encode()).digest()
+    return random.Random(int.from_bytes(digest[:8], 'big'))
+
+def get_dashboard_data(day=None):
     """
-    Generates mock data for the city-level dashboard.
+    Generates mock data for the city-level dashboard, seeded by day.
     Returns: dict with 'composition' and 'trends'
     """
+    day = day or date.today()
+    rng = simulation_rng('dashboard', day)
     # Ward-level waste composition
     wards = [f'Ward {i}' for i in range(1, 6)]
     waste_types = ['Plastic', 'Paper', 'Metal', 'Glass', 'Organic']
@@ -201,18 +220,18 @@ def get_dashboard_data():
             composition_data.append({
                 'ward': ward,
                 'type': w_type,
-                'volume': random.randint(50, 500)
+                'volume': rng.randint(50, 500)
             })
     
     # Daily Collection Trends (Past 7 days)
-    dates = pd.date_range(end=pd.Timestamp.today(), periods=7).strftime('%Y-%m-%d').tolist()
+    dates = pd.date_range(end=pd.Timestamp(day), periods=7).strftime('%Y-%m-%d').tolist()
     trend_data = []
     
-    for date in dates:
+    for trend_date in dates:
         trend_data.append({
-            'date': date,
-            'total': round(random.uniform(10, 25), 2),
-            'recyclingRate': round(random.uniform(30, 60), 2)
+            'date': trend_date,
+            'total': round(rng.uniform(10, 25), 2),
+            'recyclingRate': round(rng.uniform(30, 60), 2)
         })
     
     return {
@@ -220,31 +239,121 @@ def get_dashboard_data():
         'trends': trend_data
     }
 
-def get_pune_data():
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+PUNE_CSV_PATH = os.path.join(DATA_DIR, '167e46fa-0ac7-4abe-9043-e4ab419dcf9e.csv')
+
+# Data files parsed once and rebuilt only when their mtime changes
+_snapshot_lock = threading.Lock()
+
+def _file_snapshot(cache, path, build):
     """
-    Reads real Pune city data from CSV.
+    Returns cache['value'], rebuilding it with build(path) if the file's
+    mtime changed since the last call. None if the file is missing.
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        print(f"[ERROR] CSV not found at {path}")
+        return None
+    
+    if mtime != cache['mtime']:
+        with _snapshot_lock:
+            if mtime != cache['mtime']:
+                cache['value'] = build(path)
+                cache['mtime'] = mtime
+    return cache['value']
+
+PuneWard = namedtuple('PuneWard', ['id', 'name', 'zone', 'households', 'segregated_households', 'tpd'])
+PuneSnapshot = namedtuple('PuneSnapshot', [
+    'total_households', 'total_segregated', 'total_tpd', 'active_wards',
+    'recycling_rate', 'monthly_waste_tons', 'co2_saved', 'wards', 'ward_index'
+])
+
+_pune_snapshot = {'mtime': None, 'value': None}
+
+def _build_pune_snapshot(csv_path):
+    """
+    City totals, derived metrics and per-ward rows of the Pune CSV as an
+    immutable snapshot; ward_index maps lowercased ward name and id to a ward.
+    """
+    df = pd.read_csv(csv_path)
+    
+    # Clean column names
+    df.columns = [c.strip() for c in df.columns]
+    
+    # Basic Aggregates
+    total_households = int(df['Number of HH'].sum())
+    total_segregated = int(df['No. of Households with waste segregation'].sum())
+    total_tpd = float(df['Waste quantity (Tonnes Per Day)'].sum())
+    
+    # Derived Metrics
+    recycling_rate = int((total_segregated / total_households) * 100) if total_households > 0 else 60
+    monthly_waste_tons = int(total_tpd * 30) # Total monthly waste
+    # UI usually shows ~10k co2 for ~30k scans.
+    # If monthly_waste is ~45k, CO2 ~15k seems right.
+    co2_saved = int(monthly_waste_tons * 0.35)
+    
+    wards = tuple(
+        PuneWard(int(ward_id), name.strip(), zone if isinstance(zone, str) else None,
+                 int(households), int(segregated), float(tpd))
+        for ward_id, name, zone, households, segregated, tpd in zip(
+            df['_id'], df['Ward name'], df['Zone Name'], df['Number of HH'],
+            df['No. of Households with waste segregation'], df['Waste quantity (Tonnes Per Day)']
+        )
+    )
+    ward_index = {ward.name.lower(): ward for ward in wards}
+    ward_index.update({str(ward.id): ward for ward in wards})
+    
+    return PuneSnapshot(
+        total_households, total_segregated, total_tpd, len(df),
+        recycling_rate, monthly_waste_tons, co2_saved, wards, MappingProxyType(ward_index)
+    )
+
+def get_pune_snapshot(csv_path=PUNE_CSV_PATH):
+    """
+    Returns the Pune ward snapshot, rebuilt only when the CSV changes.
+    """
+    return _file_snapshot(_pune_snapshot, csv_path, _build_pune_snapshot)
+
+def _pune_ward_detail(ward, snapshot):
+    return {
+        'id': ward.id,
+        'ward': ward.name,
+        'zone': ward.zone,
+        'households': ward.households,
+        'segregatedHouseholds': ward.segregated_households,
+        'tonsPerDay': ward.tpd,
+        'segregationRate': int((ward.segregated_households / ward.households) * 100) if ward.households > 0 else 0,
+        'monthlyTons': int(ward.tpd * 30),
+        'shareOfCityWaste': round(ward.tpd / snapshot.total_tpd * 100, 2) if snapshot.total_tpd > 0 else 0
+    }
+
+def get_pune_ward_data(ward=None):
+    """
+    Per-ward breakdown of the Pune CSV. With ward (name, case insensitive,
+    or id) returns that ward's detail dict, None if unknown; without it a
+    list of every ward's detail.
+    """
+    snapshot = get_pune_snapshot()
+    if snapshot is None:
+        return None
+    if ward is None:
+        return [_pune_ward_detail(w, snapshot) for w in snapshot.wards]
+    match = snapshot.ward_index.get(str(ward).strip().lower())
+    return _pune_ward_detail(match, snapshot) if match else None
+
+def get_pune_data(day=None):
+    """
+    Reads real Pune city data from CSV; the weekly fluctuation is seeded
+    by day (default today).
     Returns: dict with aggregated metrics
     """
     try:
-        csv_path = os.path.join(os.path.dirname(__file__), 'data', '167e46fa-0ac7-4abe-9043-e4ab419dcf9e.csv')
-        df = pd.read_csv(csv_path)
-        
-        # Clean column names
-        df.columns = [c.strip() for c in df.columns]
-        
-        # Basic Aggregates
-        total_households = df['Number of HH'].sum()
-        total_segregated = df['No. of Households with waste segregation'].sum()
-        total_tpd = df['Waste quantity (Tonnes Per Day)'].sum()
-        active_wards = len(df)
-        
-        # Derived Metrics
-        recycling_rate = int((total_segregated / total_households) * 100) if total_households > 0 else 60
-        monthly_waste_tons = int(total_tpd * 30) # Total monthly waste
-        co2_saved = int(monthly_waste_tons * 0.5 * 1000) # Approx 0.5 kg CO2 per kg recycled (assuming part of it is recycled) -> actually let's just scale it to match UI
-        # UI usually shows ~10k co2 for ~30k scans.
-        # If monthly_waste is ~45k, CO2 ~15k seems right.
-        co2_saved = int(monthly_waste_tons * 0.35) 
+        rng = simulation_rng('pune', day)
+        snapshot = get_pune_snapshot()
+        if snapshot is None:
+            return None
+        total_tpd = snapshot.total_tpd
 
         # Generate composition (Hardcoded for Pune based on general stats)
         # 48% Organic, 30% Recyclable, etc.
@@ -262,7 +371,7 @@ def get_pune_data():
         weekly_data = []
         for day in days:
             # Random fluctuation around average TPD
-            daily_tpd = total_tpd * random.uniform(0.9, 1.1)
+            daily_tpd = total_tpd * rng.uniform(0.9, 1.1)
             weekly_data.append({
                 'day': day,
                 'Recyclable': int(daily_tpd * 0.28),
@@ -274,10 +383,10 @@ def get_pune_data():
             })
 
         return {
-            'recyclingRate': recycling_rate,
-            'monthlyScans': monthly_waste_tons, # Using Tons as the metric for "Volume"
-            'activeRoutes': active_wards,
-            'co2Saved': co2_saved,
+            'recyclingRate': snapshot.recycling_rate,
+            'monthlyScans': snapshot.monthly_waste_tons, # Using Tons as the metric for "Volume"
+            'activeRoutes': snapshot.active_wards,
+            'co2Saved': snapshot.co2_saved,
             'deltas': {
                 'recyclingRate': 2,
                 'monthlyScans': 12,
@@ -294,109 +403,157 @@ def get_pune_data():
         print(f"[ERROR] Reading Pune CSV: {e}")
         return None
 
-def get_multi_city_data(city_name):
+INDIA_CSV_PATH = india_data.CSV_PATH
+
+# Composition colours per CSV waste type
+WASTE_TYPE_COLORS = {
+    'Plastic': '#10b981',      # Emerald-500
+    'Organic': '#84cc16',      # Lime-500
+    'E-Waste': '#f59e0b',      # Amber-500
+    'Construction': '#6b7280', # Gray-500
+    'Hazardous': '#ef4444'     # Red-500
+}
+DEFAULT_WASTE_TYPE_COLOR = '#6366f1'
+
+# weeklyData series -> CSV waste type (construction is shown as landfill)
+WEEKLY_SERIES = {
+    'Recyclable': 'Plastic',
+    'Compostable': 'Organic',
+    'Landfill': 'Construction',
+    'Hazardous': 'Hazardous',
+    'EWaste': 'E-Waste'
+}
+WEEK_DAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+# compare_cities rank_by values -> city index metric
+CITY_RANKING_FIELDS = {
+    'recyclingRate': 'recycling_rate',
+    'tonsPerDay': 'tons_per_day',
+    'monthlyTons': 'monthly_waste_tons',
+    'co2Saved': 'co2_saved'
+}
+
+# (lowercased city, year) -> precomputed city metrics, rebuilt when the CSV changes
+_city_index = {'mtime': None, 'value': None}
+
+def _build_city_index(csv_path):
+    """
+    Computes every city-year's metrics with whole-column operations and
+    returns them keyed by (lowercased city, year): display name, tons per
+    day, monthly tons, weighted recycling rate, CO2 estimate, composition
+    (waste types in file order) and the per-series TPD the weekly data
+    fluctuates around.
+    """
+    df = india_data.load_india_data(csv_path)
+    city = df['City/District'].str.lower()
+    year = df['Year'].astype(np.int64)
+    tpd = df['Waste Generated (Tons/Day)'].astype(np.int64)
+    keys = [city, year]
+    
+    # Aggregates per city-year
+    # Waste Types: Plastic, Organic, E-Waste, Construction, Hazardous
+    total_tpd = tpd.groupby(keys, sort=False).sum()
+    display_name = df['City/District'].astype(str).groupby(keys, sort=False).first()
+    monthly_waste_tons = (total_tpd * 30).astype(np.int64)
+    
+    # Recycling Rate (Weighted Average)
+    # Sum(TPD * Rate) / Sum(TPD)
+    weighted_rate_sum = (tpd * df['Recycling Rate (%)'].astype(np.int64)).groupby(keys, sort=False).sum()
+    recycling_rate = (weighted_rate_sum / total_tpd.where(total_tpd > 0)).fillna(40).astype(np.int64)
+    
+    # CO2 Saved (Estimate)
+    # 0.5kg CO2 per kg recycled (approx) -> 0.5 tons per ton
+    # Recycled TPD = Total TPD * (Recycling Rate / 100)
+    recycled_tons_monthly = monthly_waste_tons * (recycling_rate / 100)
+    co2_saved = (recycled_tons_monthly * 0.5 * 1000).astype(np.int64) # kg
+    
+    # Composition share of each row within its city-year
+    row_total = tpd.groupby(keys, sort=False).transform('sum')
+    pct = ((tpd / row_total) * 100).fillna(0).astype(np.int64)
+    color = df['Waste Type'].astype(str).map(WASTE_TYPE_COLORS).fillna(DEFAULT_WASTE_TYPE_COLOR)
+    
+    # TPD behind each weeklyData series, 0 where the city lacks the waste type
+    weekly_base = df.assign(_city=city, _year=year).pivot_table(
+        index=['_city', '_year'], columns='Waste Type', values='Waste Generated (Tons/Day)',
+        aggfunc='last', observed=True
+    ).reindex(columns=list(WEEKLY_SERIES.values())).reindex(total_tpd.index).fillna(0).astype(np.float64)
+    
+    entries = {
+        key: {
+            'city': name,
+            'year': key[1],
+            'tons_per_day': tons,
+            'monthly_waste_tons': monthly,
+            'recycling_rate': rate,
+            'co2_saved': co2,
+            'composition': [],
+            'weekly_base': np.asarray(base)
+        }
+        for key, name, tons, monthly, rate, co2, base in zip(
+            total_tpd.index, display_name.tolist(), total_tpd.tolist(),
+            monthly_waste_tons.tolist(), recycling_rate.tolist(),
+            co2_saved.tolist(), weekly_base.to_numpy()
+        )
+    }
+    for key, waste_type, value, hex_color in zip(
+        zip(city.tolist(), year.tolist()), df['Waste Type'].tolist(), pct.tolist(), color.tolist()
+    ):
+        entries[key]['composition'].append({'name': waste_type, 'value': value, 'color': hex_color})
+    
+    print(f"[DATA] Indexed {len(entries)} city-years from {os.path.basename(csv_path)}")
+    return entries
+
+def get_city_index(csv_path=INDIA_CSV_PATH):
+    """
+    Returns the precomputed (city, year) metrics, reloading them if the
+    CSV's mtime changed. None if the CSV is missing.
+    """
+    return _file_snapshot(_city_index, csv_path, _build_city_index)
+
+def get_multi_city_data(city_name, day=None):
     """
     Reads data for ANY city from the comprehensive India Waste Management CSV.
-    Target Year: 2023 (Latest)
+    Target Year: 2023 (Latest). Simulated parts are seeded by (city, day).
     """
     try:
-        csv_path = os.path.join(os.path.dirname(__file__), 'data', 'Waste_Management_and_Recycling_India.csv')
-        # Check if file exists
-        if not os.path.exists(csv_path):
-            print(f"[ERROR] CSV not found at {csv_path}")
+        index = get_city_index()
+        if index is None:
             return None
-            
-        df = pd.read_csv(csv_path)
         
-        # Clean column names
-        df.columns = [c.strip() for c in df.columns]
+        # 1. Look up City (Case insensitive) and Year 2023
+        city_key = city_name.lower()
+        metrics = index.get((city_key, 2023))
         
-        # 1. Filter by City (Case insensitive) and Year 2023
-        city_df = df[
-            (df['City/District'].str.lower() == city_name.lower()) & 
-            (df['Year'] == 2023)
-        ]
-        
-        if city_df.empty:
+        if metrics is None:
             print(f"[DEBUG] No 2023 data found for {city_name}")
-            # Fallback to any year? Or just return None
-            # Let's try 2022 if 2023 is missing
-            city_df = df[
-                (df['City/District'].str.lower() == city_name.lower()) & 
-                (df['Year'] == 2022)
-            ]
-            if city_df.empty:
+            # Fallback to 2022 if 2023 is missing
+            metrics = index.get((city_key, 2022))
+            if metrics is None:
                 return None
-
-        # 2. Aggregates
-        # Waste Types: Plastic, Organic, E-Waste, Construction, Hazardous
-        total_tpd = city_df['Waste Generated (Tons/Day)'].sum()
-        monthly_waste_tons = int(total_tpd * 30)
-        
-        # Recycling Rate (Weighted Average)
-        # Sum(TPD * Rate) / Sum(TPD)
-        weighted_rate_sum = (city_df['Waste Generated (Tons/Day)'] * city_df['Recycling Rate (%)']).sum()
-        recycling_rate = int(weighted_rate_sum / total_tpd) if total_tpd > 0 else 40
-        
-        # CO2 Saved (Estimate)
-        # 0.5kg CO2 per kg recycled (approx) -> 0.5 tons per ton
-        # Recycled TPD = Total TPD * (Recycling Rate / 100)
-        recycled_tons_monthly = monthly_waste_tons * (recycling_rate / 100)
-        co2_saved = int(recycled_tons_monthly * 0.5 * 1000) # kg
-        
-        # 3. Composition
-        composition = []
-        color_map = {
-            'Plastic': '#10b981',      # Emerald-500
-            'Organic': '#84cc16',      # Lime-500
-            'E-Waste': '#f59e0b',      # Amber-500
-            'Construction': '#6b7280', # Gray-500
-            'Hazardous': '#ef4444'     # Red-500
-        }
-        
-        for index, row in city_df.iterrows():
-            w_type = row['Waste Type']
-            pct = int((row['Waste Generated (Tons/Day)'] / total_tpd) * 100)
-            composition.append({
-                'name': w_type,
-                'value': pct,
-                'color': color_map.get(w_type, '#6366f1')
-            })
-            
-        # 4. Weekly Data (Simulated around the real TPD)
-        days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-        weekly_data = []
         
-        # Get specific TPDs per type for the weekly breakdown
-        type_tpds = {row['Waste Type']: row['Waste Generated (Tons/Day)'] for _, row in city_df.iterrows()}
-        
-        for day in days:
-            # Random daily fluctuation (0.9 to 1.1)
-            daily_factor = random.uniform(0.9, 1.1)
-            
-            weekly_data.append({
-                'day': day,
-                'Recyclable': int(type_tpds.get('Plastic', 0) * daily_factor),
-                'Compostable': int(type_tpds.get('Organic', 0) * daily_factor),
-                'Landfill': int(type_tpds.get('Construction', 0) * daily_factor), # Mapping construction to landfill for viz
-                'Hazardous': int(type_tpds.get('Hazardous', 0) * daily_factor),
-                'EWaste': int(type_tpds.get('E-Waste', 0) * daily_factor),
-                'Special': 0
-            })
+        # 2. Weekly Data (Simulated around the real TPD)
+        # Random daily fluctuation (0.9 to 1.1) applied to every series at once
+        rng = simulation_rng(city_name, day)
+        daily_factors = np.array([rng.uniform(0.9, 1.1) for _ in WEEK_DAYS])
+        weekly_values = (daily_factors[:, None] * metrics['weekly_base']).astype(np.int64).tolist()
+        weekly_data = [
+            {'day': day, **dict(zip(WEEKLY_SERIES, values)), 'Special': 0}
+            for day, values in zip(WEEK_DAYS, weekly_values)
+        ]
 
         return {
-            'recyclingRate': recycling_rate,
-            'monthlyScans': monthly_waste_tons,
-            'activeRoutes': random.randint(40, 120), # Mock active routes
-            'co2Saved': co2_saved,
+            'recyclingRate': metrics['recycling_rate'],
+            'monthlyScans': metrics['monthly_waste_tons'],
+            'activeRoutes': rng.randint(40, 120), # Mock active routes
+            'co2Saved': metrics['co2_saved'],
             'deltas': {
-                'recyclingRate': random.randint(1, 5),
-                'monthlyScans': random.randint(100, 500),
+                'recyclingRate': rng.randint(1, 5),
+                'monthlyScans': rng.randint(100, 500),
                 'activeRoutes': 0,
-                'co2Saved': random.randint(50, 200)
+                'co2Saved': rng.randint(50, 200)
             },
             'weeklyData': weekly_data,
-            'composition': composition,
+            'composition': [dict(item) for item in metrics['composition']],
             'isRealData': True
         }
         
@@ -407,6 +564,63 @@ def get_multi_city_data(city_name):
         return None
 
 
+def data_version():
+    """
+    mtimes of the city index and Pune snapshot, reloading them first if
+    their files changed. Simulated responses only change with this and the day.
+    """
+    get_city_index()
+    get_pune_snapshot()
+    return (_city_index['mtime'], _pune_snapshot['mtime'])
+
+def compare_cities(cities=None, years=None, rank_by=None, top=None, ascending=False):
+    """
+    Metrics for several cities and years in one lookup over the city index.
+    cities default to every city, years to the latest year in the data.
+    rank_by (a CITY_RANKING_FIELDS key) sorts the results, descending
+    unless ascending, and top keeps the first N.
+    Returns: dict with 'results' and the 'missing' city-years, or None if
+    the CSV is unavailable.
+    """
+    if rank_by is not None and rank_by not in CITY_RANKING_FIELDS:
+        raise ValueError(f"Unknown rank_by: {rank_by}. Use one of {', '.join(CITY_RANKING_FIELDS)}")
+    
+    index = get_city_index()
+    if index is None:
+        return None
+    
+    if cities is None:
+        cities = list(dict.fromkeys(city for city, _ in index))
+    if years is None:
+        years = [max(year for _, year in index)]
+    
+    results = []
+    missing = []
+    for city in cities:
+        for year in years:
+            metrics = index.get((city.lower(), int(year)))
+            if metrics is None:
+                missing.append({'city': city, 'year': int(year)})
+                continue
+            results.append({
+                'city': metrics['city'],
+                'year': metrics['year'],
+                'tonsPerDay': metrics['tons_per_day'],
+                'monthlyTons': metrics['monthly_waste_tons'],
+                'recyclingRate': metrics['recycling_rate'],
+                'co2Saved': metrics['co2_saved'],
+                'composition': [dict(item) for item in metrics['composition']]
+            })
+    
+    if rank_by is not None:
+        results.sort(key=lambda result: result[rank_by], reverse=not ascending)
+        for rank, result in enumerate(results, 1):
+            result['rank'] = rank
+    if top is not None:
+        results = results[:max(0, int(top))]
+    
+    return {'results': results, 'missing': missing}
+
 def get_chat_response(user_message, history=[]):
     """
     Generates chatbot response using Gemini API.